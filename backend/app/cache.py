@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+
+class TTLCache:
+    """Bounded in-process cache with per-entry TTL, LRU eviction and tag invalidation.
+
+    Entries can be tagged (e.g. with the product ids they contain) so a write
+    can drop exactly the entries it affects. ``generation`` advances on every
+    invalidation; readers capture it before loading and pass it to ``set``,
+    which discards the value only if one of *its* tags (or the whole cache) was
+    invalidated since, so a write to one product doesn't void unrelated fills.
+    ``invalidated_at`` (monotonic) lets readers of a lagging replica hold off
+    caching right after a write.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.invalidated_at = 0.0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Tuple[Hashable, ...]]]" = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        # generation at which each tag, or everything, was last invalidated
+        self._tag_generations: Dict[Hashable, int] = {}
+        self._cleared_generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        tags: Iterable[Hashable] = (),
+        generation: Optional[int] = None,
+    ) -> None:
+        tags = tuple(tags)
+        if self.maxsize <= 0 or (generation is not None and self._stale(tags, generation)):
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _stale(self, tags: Tuple[Hashable, ...], generation: int) -> bool:
+        if self._cleared_generation > generation:
+            return True
+        return any(self._tag_generations.get(tag, 0) > generation for tag in tags)
+
+    def invalidate_tags(self, tags: Iterable[Hashable]) -> int:
+        """Drop every entry carrying any of ``tags``; returns how many were dropped."""
+        self.generation += 1
+        self.invalidated_at = time.monotonic()
+        keys: Set[Hashable] = set()
+        for tag in tags:
+            self._tag_generations[tag] = self.generation
+            keys |= self._tags.get(tag, set())
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._cleared_generation = self.generation
+        # superseded by _cleared_generation for any fill that started before now
+        self._tag_generations.clear()
+        self.invalidated_at = time.monotonic()
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tags.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class SingleFlight:
+    """Coalesce concurrent loads of the same key into one in-flight call.
+
+    The load runs as its own task and callers await it shielded, so one caller
+    being cancelled does not cancel the load for everyone else waiting on it.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(load())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import math
+import time
+
+from fastapi import Request, Response
+
+from .db_config import get_replica_lag_tolerance
+
+REPLICA_LAG_TOLERANCE_SECONDS = get_replica_lag_tolerance()
+
+# Set on a client after it writes, so its reads skip the replica until the
+# replica can be assumed to have caught up.
+RECENT_WRITE_COOKIE = "skipline_recent_write"
+CONSISTENCY_HEADER = "X-Read-Consistency"
+
+
+def mark_recent_write(response: Response) -> None:
+    response.set_cookie(
+        RECENT_WRITE_COOKIE,
+        str(time.time() + REPLICA_LAG_TOLERANCE_SECONDS),
+        max_age=math.ceil(REPLICA_LAG_TOLERANCE_SECONDS),
+        httponly=True,
+        samesite="lax",
+    )
+
+
+def needs_primary(request: Request) -> bool:
+    """True when this client must read its own writes (recent write, or ``X-Read-Consistency: primary``)."""
+    if request.headers.get(CONSISTENCY_HEADER, "").lower() == "primary":
+        return True
+    until = request.cookies.get(RECENT_WRITE_COOKIE)
+    try:
+        return until is not None and float(until) > time.time()
+    except ValueError:
+        return False
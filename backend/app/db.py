@@ -1,30 +1,75 @@
 from __future__ import annotations
 
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
+from typing import AsyncIterator, Iterable
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import Table, event, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
-from .db_config import get_database_url
+from .db_config import get_database_url, get_pool_options, get_read_database_url, get_sqlite_pragmas, is_sqlite
+from .db_pool import InstrumentedQueuePool
 
 DATABASE_URL = get_database_url()
+READ_DATABASE_URL = get_read_database_url()
 print(f"Using database URL: {DATABASE_URL}")
+if READ_DATABASE_URL:
+    print(f"Using read replica URL: {READ_DATABASE_URL}")
 
-engine = create_async_engine(
-    DATABASE_URL, 
-    future=True, 
-    echo=False,
-    # Enable SQLAlchemy integration to work with async
-    pool_pre_ping=True,
-)
+
+def _make_engine(url: str) -> AsyncEngine:
+    pool_options = get_pool_options(url)
+    if "pool_size" in pool_options:
+        # instrumented so /metrics/db-pool can report acquisition waits
+        pool_options["poolclass"] = InstrumentedQueuePool
+
+    new_engine = create_async_engine(
+        url,
+        future=True,
+        echo=False,
+        **pool_options,
+    )
+
+    if is_sqlite(url):
+        sqlite_pragmas = get_sqlite_pragmas()
+
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in sqlite_pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return new_engine
+
+
+engine = _make_engine(DATABASE_URL)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Without DATABASE_READ_URL, reads share the primary engine.
+read_engine = _make_engine(READ_DATABASE_URL) if READ_DATABASE_URL else engine
+ReadSessionLocal = async_sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession)
+
 
 class Base(DeclarativeBase):
     pass
 
 
+async def reset_id_sequences(conn: AsyncConnection, tables: Iterable[Table]) -> None:
+    """Move Postgres ``id`` sequences past rows inserted with explicit ids (restores, generated datasets)."""
+    if conn.dialect.name != "postgresql":
+        return
+    for table in tables:
+        if "id" not in table.c or list(table.primary_key.columns) != [table.c.id]:
+            continue
+        await conn.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table.name}"
+            )
+        )
+
+
 @asynccontextmanager
 async def lifespan_session() -> AsyncIterator[AsyncSession]:
     session = SessionLocal()
@@ -32,3 +77,13 @@ async def lifespan_session() -> AsyncIterator[AsyncSession]:
         yield session
     finally:
         await session.close()
+
+
+@asynccontextmanager
+async def lifespan_read_session(primary: bool = False) -> AsyncIterator[AsyncSession]:
+    """Session for read-only routes: the replica, or the primary when ``primary`` is set."""
+    session = SessionLocal() if primary else ReadSessionLocal()
+    try:
+        yield session
+    finally:
+        await session.close()
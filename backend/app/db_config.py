@@ -10,18 +10,77 @@ def get_database_url() -> str:
     database_url = os.getenv("DATABASE_URL")
     
     if database_url:
-        # Handle Render/Railway PostgreSQL URLs
-        if database_url.startswith("postgres://"):
-            # Convert to asyncpg format for SQLAlchemy
-            database_url = database_url.replace("postgres://", "postgresql+asyncpg://")
-        elif database_url.startswith("postgresql://"):
-            # Convert to asyncpg format for SQLAlchemy
-            database_url = database_url.replace("postgresql://", "postgresql+asyncpg://")
-        return database_url
+        return _normalize_url(database_url)
     
     # Default to SQLite for local development
     return "sqlite+aiosqlite:///./skipline.db"
 
-def is_sqlite() -> bool:
+def _normalize_url(database_url: str) -> str:
+    # Handle Render/Railway PostgreSQL URLs
+    if database_url.startswith("postgres://"):
+        # Convert to asyncpg format for SQLAlchemy
+        database_url = database_url.replace("postgres://", "postgresql+asyncpg://")
+    elif database_url.startswith("postgresql://"):
+        # Convert to asyncpg format for SQLAlchemy
+        database_url = database_url.replace("postgresql://", "postgresql+asyncpg://")
+    return database_url
+
+def get_read_database_url() -> Optional[str]:
+    """
+    Optional read replica (DATABASE_READ_URL) for catalog and other GET routes.
+    Writes always go to get_database_url().
+    """
+    read_url = os.getenv("DATABASE_READ_URL")
+    return _normalize_url(read_url) if read_url else None
+
+def get_replica_lag_tolerance() -> float:
+    """Seconds after a write during which reads that must see it go to the primary."""
+    return float(os.getenv("REPLICA_LAG_TOLERANCE_SECONDS", "5"))
+
+def is_sqlite(database_url: Optional[str] = None) -> bool:
     """Check if we're using SQLite."""
-    return "sqlite" in get_database_url()
+    return "sqlite" in (database_url or get_database_url())
+
+def get_pool_options(database_url: Optional[str] = None) -> dict:
+    """
+    Connection pool settings for create_async_engine, from environment.
+    Pre-ping costs a round trip on every checkout, so it is off by default and
+    stale connections are instead retired by age (DB_POOL_RECYCLE seconds).
+    """
+    database_url = database_url or get_database_url()
+    options = {
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "false").lower() == "true",
+    }
+    if ":memory:" in database_url:
+        # in-memory SQLite uses a single static connection; sizing does not apply
+        return options
+    sqlite = "sqlite" in database_url
+    options.update(
+        # SQLite serializes writers, so beyond a handful of WAL readers more
+        # connections only add lock contention; nothing to recycle on a local file
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5" if sqlite else "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "5" if sqlite else "20")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "-1" if sqlite else "1800")),
+    )
+    return options
+
+
+def get_sqlite_pragmas() -> dict:
+    """
+    PRAGMAs applied to every new SQLite connection (SQLITE_PROFILE=tuned, the default).
+    WAL lets catalog reads proceed while a checkout writes; synchronous=NORMAL is
+    durable across app crashes in WAL mode and only skips the fsync per commit.
+    SQLITE_PROFILE=default keeps SQLite's stock settings, e.g. for benchmarking.
+    """
+    if os.getenv("SQLITE_PROFILE", "tuned").lower() != "tuned":
+        return {}
+    return {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        # negative cache_size is in KiB
+        "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+        "temp_store": "MEMORY",
+    }
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Upper bounds (ms) of the connection-acquisition wait histogram; the last bucket is open-ended.
+WAIT_BUCKETS_MS: List[float] = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each connection checkout waited."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_counts = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_total_ms = 0.0
+        self.acquisitions = 0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        waited_ms = (time.perf_counter() - start) * 1000
+        self.acquisitions += 1
+        self.wait_total_ms += waited_ms
+        self.wait_counts[bisect_left(WAIT_BUCKETS_MS, waited_ms)] += 1
+        return conn
+
+
+def pool_stats(pool: Any) -> Dict[str, Any]:
+    """Checked-out/idle/overflow counts and the acquisition wait histogram for ``pool``."""
+    stats: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+            max_overflow=pool._max_overflow,
+            timeout_seconds=pool.timeout(),
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        labels = [f"le_{int(b)}ms" for b in WAIT_BUCKETS_MS] + ["gt_5000ms"]
+        stats.update(
+            acquisitions=pool.acquisitions,
+            timeouts=pool.timeouts,
+            mean_wait_ms=round(pool.wait_total_ms / pool.acquisitions, 3) if pool.acquisitions else None,
+            wait_histogram=dict(zip(labels, pool.wait_counts)),
+        )
+    return stats
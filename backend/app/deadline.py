@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+from fastapi import Header
+
+T = TypeVar("T")
+
+# Upper bound on a checkout; clients may ask for less with X-Request-Deadline-Ms.
+CHECKOUT_DEADLINE_MS = int(os.getenv("CHECKOUT_DEADLINE_MS", "10000"))
+
+
+class DeadlineExceeded(Exception):
+    """The request's latency budget ran out (or cannot cover ``stage``)."""
+
+    def __init__(self, stage: str, budget_ms: float) -> None:
+        super().__init__(f"deadline exceeded during {stage}")
+        self.stage = stage
+        self.budget_ms = budget_ms
+
+
+class Deadline:
+    def __init__(self, budget_ms: float) -> None:
+        self.budget_ms = budget_ms
+        self._expires_at = time.monotonic() + budget_ms / 1000.0
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def check(self, stage: str, needed_seconds: float = 0.0) -> None:
+        """Fail fast if the remaining budget cannot cover ``needed_seconds`` for ``stage``."""
+        remaining = self.remaining()
+        if remaining <= 0 or remaining < needed_seconds:
+            raise DeadlineExceeded(stage, self.budget_ms)
+
+
+# Tasks spawned while handling the request (gather, hedges) inherit it.
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+async def within(aw: Awaitable[T], stage: str) -> T:
+    """Await ``aw`` with whatever is left of the current deadline, cancelling it on expiry."""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return await aw
+    try:
+        deadline.check(stage)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise
+    try:
+        return await asyncio.wait_for(aw, timeout=deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage, deadline.budget_ms) from None
+
+
+async def checkout_deadline(
+    x_request_deadline_ms: Optional[int] = Header(default=None, alias="X-Request-Deadline-Ms"),
+) -> Deadline:
+    """FastAPI dependency: start the request's budget. Endpoints make it current with ``current_deadline.set``."""
+    budget_ms = CHECKOUT_DEADLINE_MS
+    if x_request_deadline_ms is not None and x_request_deadline_ms > 0:
+        budget_ms = min(budget_ms, x_request_deadline_ms)
+    return Deadline(budget_ms)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import sentry_sdk
+from sentry_sdk import logger as sentry_logger
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "off": 100}
+
+BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "0.5"))
+
+DEFAULT_LEVEL = "warning"
+
+_stdlib = logging.getLogger("skipline")
+
+# (level, route, template, fields)
+Record = Tuple[int, str, str, Dict[str, Any]]
+
+
+def _env_level(value: str) -> int:
+    level = LEVELS.get(value.strip().lower())
+    if level is None:
+        _stdlib.warning("Ignoring LOG_LEVEL=%r (expected one of %s); using %s", value, ", ".join(LEVELS), DEFAULT_LEVEL)
+        return LEVELS[DEFAULT_LEVEL]
+    return level
+
+
+def _parse_route_levels(spec: str) -> Dict[str, int]:
+    """Parse ``route=level,...``; malformed entries are skipped with a warning rather than failing startup."""
+    levels = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        route, _, level = part.partition("=")
+        parsed = LEVELS.get(level.strip().lower())
+        if not route.strip() or parsed is None:
+            _stdlib.warning("Ignoring LOG_ROUTE_LEVELS entry %r (expected route=%s)", part, "|".join(LEVELS))
+            continue
+        levels[route.strip()] = parsed
+    return levels
+
+
+_default_level = _env_level(os.getenv("LOG_LEVEL", DEFAULT_LEVEL))
+_route_levels: Dict[str, int] = _parse_route_levels(os.getenv("LOG_ROUTE_LEVELS", ""))
+
+
+def set_route_levels(levels: Dict[str, str]) -> None:
+    """Change per-route levels at runtime; ``"default"`` sets the level for unlisted routes."""
+    global _default_level
+    parsed = {route: LEVELS[level.lower()] for route, level in levels.items()}
+    if "default" in parsed:
+        _default_level = parsed.pop("default")
+    _route_levels.update(parsed)
+
+
+def route_levels() -> Dict[str, str]:
+    names = {v: k for k, v in LEVELS.items()}
+    return {"default": names[_default_level], **{r: names[l] for r, l in sorted(_route_levels.items())}}
+
+
+class _Shipper:
+    """Formats and forwards records in batches from a background thread, off the event loop."""
+
+    def __init__(self) -> None:
+        self._queue: "queue.SimpleQueue[Optional[Record]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def put(self, record: Record) -> None:
+        if self._thread is None:
+            self._start()
+        self._queue.put(record)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=2)
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Record] = []
+            try:
+                batch.append(self._queue.get(timeout=FLUSH_SECONDS))
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            stopping = None in batch
+            self._ship([r for r in batch if r is not None])
+            if stopping:
+                return
+
+    def _ship(self, batch: List[Record]) -> None:
+        for level, route, template, fields in batch:
+            try:
+                message = template.format(**fields)
+            except (KeyError, IndexError, ValueError):
+                message = template
+            _stdlib.log(level, "[%s] %s %s", route, message, fields if fields else "")
+            emit = {10: sentry_logger.debug, 20: sentry_logger.info, 30: sentry_logger.warning}.get(
+                level, sentry_logger.error
+            )
+            emit(template, attributes={"route": route}, **fields)
+
+
+_shipper = _Shipper()
+
+
+class RouteLogger:
+    """Level-gated, structured logger for one route.
+
+    Messages are ``str.format`` templates filled from keyword fields. Nothing is
+    formatted unless the route's level is enabled, and a field given as a
+    zero-argument callable is only evaluated then, so disabled calls cost a
+    dict lookup.
+    """
+
+    def __init__(self, route: str) -> None:
+        self.route = route
+
+    def enabled(self, level: int) -> bool:
+        return level >= _route_levels.get(self.route, _default_level)
+
+    def _log(self, level: int, template: str, fields: Dict[str, Any]) -> None:
+        if not self.enabled(level):
+            return
+        fields = {k: v() if callable(v) else v for k, v in fields.items()}
+        span = sentry_sdk.get_current_span()
+        if span is not None:
+            # the shipper thread has no request scope, so carry the trace along explicitly
+            fields.setdefault("trace_id", span.trace_id)
+        _shipper.put((level, self.route, template, fields))
+
+    def debug(self, template: str, **fields: Any) -> None:
+        self._log(10, template, fields)
+
+    def info(self, template: str, **fields: Any) -> None:
+        self._log(20, template, fields)
+
+    def warning(self, template: str, **fields: Any) -> None:
+        self._log(30, template, fields)
+
+    def error(self, template: str, **fields: Any) -> None:
+        self._log(40, template, fields)
+
+
+def get_logger(route: str) -> RouteLogger:
+    return RouteLogger(route)
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import os
+import secrets
 from contextlib import asynccontextmanager
+from typing import Dict, Optional
 
 from dotenv import load_dotenv
 
@@ -10,11 +12,28 @@ load_dotenv()
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import inspect
 
-from .db import Base, engine
+from .db import READ_DATABASE_URL, Base, SessionLocal, engine, read_engine
+from .db_config import is_sqlite
+from .db_pool import pool_stats
+from .deadline import DeadlineExceeded
+from .log import route_levels, set_route_levels
+from .models import Product
 from .routers import v1, v2
+from .sampling import sampler_from_env
+from .services.catalog import catalog_cache, invalidate_category_ids, product_cache, product_flight
+from .services.external import dependency_stats, shipping_cache_stats
+from .services.inventory import ensure_inventory_balances
+from .services.outbox import OUTBOX_WORKERS, OutboxWorker
+from .services.pricing import coupon_index
+from .services.search import ensure_search_index
+
+# Enables the mutating /admin endpoints; unset (the default) they return 404.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 
 def init_sentry():
@@ -26,16 +45,16 @@ def init_sentry():
     
     sentry_sdk.init(
         dsn=dsn,
-        debug=True,
+        debug=os.getenv("SENTRY_DEBUG", "false").lower() == "true",
         # Add data like request headers and IP for users, if applicable;
         # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
         send_default_pii=True,
-        # Set traces_sample_rate to 1.0 to capture 100%
-        # of transactions for tracing.
-        traces_sample_rate=1.0,
-        # To collect profiles for all profile sessions,
-        # set `profile_session_sample_rate` to 1.0.
-        profile_session_sample_rate=1.0,
+        # Per-route trace rates (checkout fully, catalog at 1%) scaled to a
+        # traces-per-second budget under load. Errors are sent regardless of
+        # trace sampling, so failed checkouts are always reported.
+        traces_sampler=sampler_from_env(),
+        # Fraction of profile sessions; profiles only run inside sampled traces.
+        profile_session_sample_rate=float(os.getenv("SENTRY_PROFILE_SESSION_SAMPLE_RATE", "0.1")),
         # Profiles will be automatically collected while
         # there is an active span.
         profile_lifecycle="trace",
@@ -52,14 +71,49 @@ def init_sentry():
     )
 
 
+def _create_missing_indexes(conn) -> None:
+    for index in Product.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _check_replica_schema(conn) -> None:
+    # the app never writes to the replica, so it cannot create what is missing there
+    existing = set(inspect(conn).get_table_names())
+    missing = sorted(name for name in Base.metadata.tables if name not in existing)
+    if missing:
+        raise RuntimeError(
+            f"Read replica {conn.engine.url.render_as_string(hide_password=True)} is missing tables "
+            f"{', '.join(missing)}. Point DATABASE_READ_URL at a replica of DATABASE_URL "
+            "(for SQLite, copy it with sqlite3 \".backup\"; a plain cp can miss the WAL)."
+        )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips indexes on tables that already exist
+        await conn.run_sync(_create_missing_indexes)
+        await conn.run_sync(ensure_search_index)
+    if read_engine is not engine:
+        async with read_engine.begin() as conn:
+            await conn.run_sync(_check_replica_schema)
+            if is_sqlite(READ_DATABASE_URL):
+                # /search reads through the read engine; a separate SQLite file needs its
+                # own FTS table (a Postgres replica receives the index through replication)
+                await conn.run_sync(ensure_search_index)
+    async with SessionLocal() as session:
+        await ensure_inventory_balances(session)
+        await coupon_index.refresh(session, force=True)
+    # OUTBOX_WORKERS=0 leaves draining to scripts/outbox_worker.py
+    if OUTBOX_WORKERS > 0:
+        outbox_worker.start()
     yield
+    await outbox_worker.stop()
 
 
 init_sentry()
+outbox_worker = OutboxWorker(SessionLocal)
 app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
@@ -75,17 +129,94 @@ app.include_router(v1.router)
 app.include_router(v2.router)
 
 
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(
+        status_code=504,
+        content={
+            "detail": {
+                "error": "deadline_exceeded",
+                "message": f"Request could not finish within {exc.budget_ms}ms (ran out during {exc.stage})",
+                "stage": exc.stage,
+                "budget_ms": exc.budget_ms,
+            }
+        },
+    )
+
+
 @app.get("/")
 async def root(request: Request):
     return {"ok": True}
 
 
+@app.get("/metrics/db-pool")
+async def db_pool_metrics():
+    """Connection pool saturation: checked-out/idle/overflow and acquisition wait histogram."""
+    stats = {"primary": pool_stats(engine.pool)}
+    if read_engine is not engine:
+        stats["read"] = pool_stats(read_engine.pool)
+    return stats
+
+
+@app.get("/metrics/catalog-cache")
+async def catalog_cache_metrics():
+    """Hit/miss/eviction counters for sizing the v2 catalog page cache."""
+    return catalog_cache.stats()
+
+
+@app.get("/metrics/product-cache")
+async def product_cache_metrics():
+    """v2 product detail cache hits/misses and how many concurrent misses were coalesced."""
+    return {**product_cache.stats(), "loads": product_flight.calls, "coalesced": product_flight.coalesced}
+
+
+@app.get("/metrics/shipping-cache")
+async def shipping_cache_metrics():
+    """Shipping-quote cache hits/misses and how many upstream calls were coalesced."""
+    return shipping_cache_stats()
+
+
+@app.get("/metrics/dependencies")
+async def dependency_metrics():
+    """Per-dependency breaker state, hedging and latency percentiles for external calls."""
+    return dependency_stats()
+
+
+@app.get("/metrics/outbox")
+async def outbox_metrics():
+    """Outbox queue depth, dead letters and drain rate."""
+    return await outbox_worker.metrics()
+
+
+@app.get("/admin/log-levels")
+async def get_log_levels():
+    return route_levels()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None, alias="X-Admin-Token")) -> None:
+    """Admin endpoints answer only with ``X-Admin-Token: $ADMIN_TOKEN``; without ADMIN_TOKEN set they are off."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail={"error": "forbidden", "message": "Invalid admin token"})
+
+
+@app.put("/admin/log-levels", dependencies=[Depends(require_admin)])
+async def put_log_levels(levels: Dict[str, str]):
+    """Change log levels per route (e.g. {"v2.checkout": "debug"}) without a restart."""
+    try:
+        set_route_levels(levels)
+    except KeyError as exc:
+        raise HTTPException(status_code=400, detail={"error": "invalid_level", "message": f"Unknown level {exc}"})
+    return route_levels()
+
+
 @app.post("/seed-database")
 async def seed_database():
     """One-time database seeding endpoint."""
     from sqlalchemy import select
-    from .models import Product, Category, User, Coupon, InventoryMovement
-    from .db import SessionLocal
+    from .models import Product, Category, User, Coupon
+    from .services.inventory import record_movements
     import random
     from datetime import datetime, timedelta
     
@@ -139,12 +270,10 @@ async def seed_database():
         await session.flush()
         
         # Add inventory
-        for product in products:
-            movement = InventoryMovement(
-                product_id=product.id,
-                delta=random.randint(5, 50)
-            )
-            session.add(movement)
+        await record_movements(
+            session,
+            [{"product_id": product.id, "delta": random.randint(5, 50)} for product in products],
+        )
         
         # Add coupons
         coupons = [
@@ -167,6 +296,7 @@ async def seed_database():
         session.add_all(coupons)
         
         await session.commit()
+        invalidate_category_ids()
         
         return {
             "status": "success",
@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, func
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, String, Text, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -26,11 +26,14 @@ class Category(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    # Leading category_id also serves plain category lookups; trailing id lets a
+    # filtered catalog page (offset or cursor) be read in order from the index.
+    __table_args__ = (Index("ix_products_category_id_id", "category_id", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
     slug: Mapped[str] = mapped_column(String(255), index=True, nullable=False)
-    category_id: Mapped[int] = mapped_column(ForeignKey("categories.id"), index=True)
+    category_id: Mapped[int] = mapped_column(ForeignKey("categories.id"))
     price_cents: Mapped[int] = mapped_column(Integer, nullable=False)
     image_url: Mapped[Optional[str]] = mapped_column(String(500))
 
@@ -46,6 +49,21 @@ class InventoryMovement(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
 
 
+class InventoryBalance(Base):
+    """Running stock per product, maintained alongside every InventoryMovement write.
+
+    ``last_movement_id`` is the high-water mark of the ledger rows folded into
+    ``quantity``; ``scripts/db_manager.py verify-balances`` checks it against the ledger.
+    """
+
+    __tablename__ = "inventory_balances"
+
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id"), primary_key=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_movement_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
+
+
 class Coupon(Base):
     __tablename__ = "coupons"
 
@@ -79,3 +97,24 @@ class OrderItem(Base):
     product_id: Mapped[int] = mapped_column(ForeignKey("products.id"))
     quantity: Mapped[int] = mapped_column(Integer, nullable=False)
     unit_price_cents: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class OutboxEvent(Base):
+    """Side effect (e.g. confirmation email) committed in the same transaction as its order.
+
+    ``available_at`` doubles as the claim lease: a worker pushes it forward when it
+    takes the event, so events held by a crashed worker are retried once it lapses.
+    """
+
+    __tablename__ = "outbox_events"
+    __table_args__ = (Index("ix_outbox_events_status_available_at", "status", "available_at"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    available_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
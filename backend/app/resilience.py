@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from .deadline import DeadlineExceeded, current_deadline
+
+
+class DependencyUnavailable(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"{name} is unavailable (circuit open)")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Rolling-window breaker: opens when too many recent calls failed or were too slow.
+
+    After ``open_seconds`` it lets a single probe through (half-open); the probe's
+    outcome closes the breaker again or re-opens it for another period.
+    """
+
+    def __init__(
+        self,
+        failure_ratio: float = 0.5,
+        slow_call_ms: float = 1000.0,
+        window: int = 50,
+        min_calls: int = 10,
+        open_seconds: float = 10.0,
+    ) -> None:
+        self.failure_ratio = failure_ratio
+        self.slow_call_ms = slow_call_ms
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.open_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """Forget an in-flight probe that was cancelled before it produced an outcome."""
+        self._probing = False
+
+    def record(self, ok: bool, elapsed_ms: float) -> None:
+        healthy = ok and elapsed_ms <= self.slow_call_ms
+        if self._probing:
+            self._probing = False
+            if healthy:
+                self._opened_at = None
+                self._outcomes.clear()
+            else:
+                self._opened_at = time.monotonic()
+                self.times_opened += 1
+            return
+        self._outcomes.append(healthy)
+        if self._opened_at is None and len(self._outcomes) >= self.min_calls:
+            bad = self._outcomes.count(False)
+            if bad / len(self._outcomes) >= self.failure_ratio:
+                self._opened_at = time.monotonic()
+                self.times_opened += 1
+
+
+class Dependency:
+    """Hedging, circuit breaking and stats for one external dependency.
+
+    ``hedge_percentile`` enables hedging: if a call has not returned after the
+    dependency's recent p-th percentile latency, a duplicate is sent and the
+    first success wins. Only hedge idempotent calls; pass ``hedge=False`` otherwise.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        breaker: CircuitBreaker,
+        hedge_percentile: Optional[float] = None,
+        min_samples: int = 20,
+        window: int = 500,
+    ) -> None:
+        self.name = name
+        self.breaker = breaker
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.fallbacks = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def percentile_ms(self, p: float) -> Optional[float]:
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        fallback: Optional[Callable[[], Any]] = None,
+        hedge: bool = True,
+    ) -> Any:
+        # Don't start a call the request can no longer wait for. Checked before
+        # allow(): a half-open breaker hands out its single probe there, and a
+        # probe that never runs would leave the breaker waiting on it forever.
+        deadline = current_deadline.get()
+        if deadline is not None:
+            typical_ms = self.percentile_ms(50) or 0.0
+            deadline.check(self.name, needed_seconds=typical_ms / 1000.0)
+
+        if not self.breaker.allow():
+            self.rejected += 1
+            if fallback is not None:
+                self.fallbacks += 1
+                return fallback()
+            raise DependencyUnavailable(self.name)
+
+        self.calls += 1
+        start = time.perf_counter()
+        try:
+            result = await self._hedged(fn) if hedge else await self._attempt(fn)
+        except (asyncio.CancelledError, DeadlineExceeded):
+            self.breaker.release_probe()
+            raise
+        except Exception:
+            self.failures += 1
+            self.breaker.record(False, (time.perf_counter() - start) * 1000)
+            if fallback is not None:
+                self.fallbacks += 1
+                return fallback()
+            raise
+        self.breaker.record(True, (time.perf_counter() - start) * 1000)
+        return result
+
+    async def _attempt(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        start = time.perf_counter()
+        result = await fn()
+        self._latencies.append((time.perf_counter() - start) * 1000)
+        return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        delay_ms = self.percentile_ms(self.hedge_percentile) if self.hedge_percentile else None
+        if delay_ms is None:
+            return await self._attempt(fn)
+
+        primary = asyncio.ensure_future(self._attempt(fn))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay_ms / 1000.0)
+            if done:
+                return primary.result()
+            self.hedges += 1
+            pending.add(asyncio.ensure_future(self._attempt(fn)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "times_opened": self.breaker.times_opened,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "fallbacks": self.fallbacks,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": self.percentile_ms(50),
+            "p95_ms": self.percentile_ms(95),
+            "p99_ms": self.percentile_ms(99),
+        }
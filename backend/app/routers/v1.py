@@ -3,19 +3,23 @@ from __future__ import annotations
 from typing import List, Optional
 
 import sentry_sdk
-from sentry_sdk import logger
-from fastapi import APIRouter, Depends, Header, Query
+from fastapi import APIRouter, Depends, Header, Query, Request
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import lifespan_session
-from ..models import InventoryMovement, Product
+from ..consistency import needs_primary
+from ..db import lifespan_read_session, lifespan_session
+from ..deadline import Deadline, checkout_deadline, current_deadline, within
+from ..log import get_logger
+from ..models import Category, InventoryMovement, Product
 from ..schemas import CheckoutIn, CheckoutOut, ProductOut
 from ..services.external import payment_charge, shipping_quote, tax_compute
 from ..services.inventory import get_inventory_for_product_naive
 from ..services.pricing import apply_coupon_naive
 
 router = APIRouter(prefix="/api/v1")
+catalog_log = get_logger("v1.catalog")
+checkout_log = get_logger("v1.checkout")
 
 
 async def get_session() -> AsyncSession:
@@ -23,32 +27,42 @@ async def get_session() -> AsyncSession:
         yield s
 
 
+async def get_read_session(request: Request) -> AsyncSession:
+    async with lifespan_read_session(primary=needs_primary(request)) as s:
+        yield s
+
+
 @router.get("/catalog", response_model=List[ProductOut])
 async def catalog(
     category: Optional[str] = Query(default=None),
     limit: int = 20,
     offset: int = 0,
     x_scenario: Optional[str] = Header(default=None, alias="X-Scenario"),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
-    logger.debug(f"Listing products with category={category}, limit={limit}, offset={offset}")
+    catalog_log.debug("Listing products with category={category}, limit={limit}, offset={offset}", category=category, limit=limit, offset=offset)
     
     q = select(Product)
     if category:
-        # still naive: filter products by slug pattern on product slug
-        q = q.where(Product.slug.like(f"{category}-%"))
-        logger.info(f"Filtering products by category: {category}")
+        # still naive: join categories on every request instead of caching the slug -> id map
+        q = q.join(Category, Product.category_id == Category.id).where(Category.slug == category)
+        catalog_log.info("Filtering products by category: {category}", category=category)
         
     products = (await session.execute(q.offset(offset).limit(limit))).scalars().all()
 
-    logger.info(f"Found {len(products)} products")
+    catalog_log.info("Found {count} products", count=len(products))
 
     result: List[ProductOut] = []
     for p in products:
         inv = await get_inventory_for_product_naive(session, p.id)
         result.append(ProductOut.model_validate({**p.__dict__, "inventory": inv}))
     
-    logger.warning(f"Using naive inventory calculation - performed {len(products)} separate queries with 200ms latency each = {len(products) * 200}ms = {len(products) * 0.2:.1f}s overhead!")
+    catalog_log.warning(
+        "Using naive inventory calculation - performed {queries} separate queries with 200ms latency each = {overhead_ms}ms = {overhead_s:.1f}s overhead!",
+        queries=len(products),
+        overhead_ms=len(products) * 200,
+        overhead_s=len(products) * 0.2,
+    )
     return result
 
 
@@ -56,26 +70,33 @@ async def catalog(
 async def checkout(
     payload: CheckoutIn,
     x_scenario: Optional[str] = Header(default=None, alias="X-Scenario"),
+    deadline: Deadline = Depends(checkout_deadline),
     session: AsyncSession = Depends(get_session),
 ):
-    logger.info(f"Starting checkout process for {payload.user_email} with {len(payload.items)} items")
+    current_deadline.set(deadline)
+    checkout_log.info("Starting checkout process for {email} with {items} items", email=payload.user_email, items=len(payload.items))
     
     # naive sequential work
     subtotal = 0
     for item in payload.items:
-        logger.debug(f"Processing item: product_id={item.product_id}, quantity={item.quantity}")
+        checkout_log.debug("Processing item: product_id={product_id}, quantity={quantity}", product_id=item.product_id, quantity=item.quantity)
         
         # Simulate slow product lookup
         import asyncio
-        await asyncio.sleep(0.1)  # 100ms per product lookup
+        await within(asyncio.sleep(0.1), "load_products")  # 100ms per product lookup
         
-        prod = (await session.execute(select(Product).where(Product.id == item.product_id))).scalars().first()
+        prod = (await within(session.execute(select(Product).where(Product.id == item.product_id)), "load_products")).scalars().first()
         if not prod:
-            logger.error(f"Product {item.product_id} not found")
+            checkout_log.error("Product {product_id} not found", product_id=item.product_id)
             continue
-        inv = await get_inventory_for_product_naive(session, prod.id)
+        inv = await within(get_inventory_for_product_naive(session, prod.id), "inventory")
         if inv < item.quantity:
-            logger.error(f"Insufficient inventory for product {prod.id}: requested={item.quantity}, available={inv}")
+            checkout_log.error(
+                "Insufficient inventory for product {product_id}: requested={requested}, available={available}",
+                product_id=prod.id,
+                requested=item.quantity,
+                available=inv,
+            )
             from fastapi import HTTPException
             raise HTTPException(
                 status_code=400,
@@ -90,30 +111,40 @@ async def checkout(
             )
         subtotal += prod.price_cents * item.quantity
 
-    logger.info(f"Calculated subtotal: ${subtotal/100:.2f}")
+    checkout_log.info("Calculated subtotal: ${subtotal:.2f}", subtotal=subtotal / 100)
 
-    logger.info("Starting SEQUENTIAL checkout calculations...")
-    discount = await apply_coupon_naive(session, subtotal, payload.coupon_code)
-    logger.debug(f"✓ Coupon calculated: ${discount/100:.2f} discount")
+    checkout_log.info("Starting SEQUENTIAL checkout calculations...")
+    discount = await within(apply_coupon_naive(session, subtotal, payload.coupon_code), "coupon")
+    checkout_log.debug("✓ Coupon calculated: ${discount:.2f} discount", discount=discount / 100)
     
-    shipping = await shipping_quote(payload.address or "", subtotal, x_scenario)
-    logger.debug(f"✓ Shipping calculated: ${shipping/100:.2f}")
+    shipping = await within(shipping_quote(payload.address or "", subtotal, x_scenario), "shipping")
+    checkout_log.debug("✓ Shipping calculated: ${shipping:.2f}", shipping=shipping / 100)
     
-    tax = await tax_compute(payload.address or "", subtotal)
-    logger.debug(f"✓ Tax calculated: ${tax/100:.2f}")
+    tax = await within(tax_compute(payload.address or "", subtotal), "tax")
+    checkout_log.debug("✓ Tax calculated: ${tax:.2f}", tax=tax / 100)
 
     total = subtotal - discount + shipping + tax
-    logger.info(f"Final total: ${total/100:.2f} (discount=${discount/100:.2f}, shipping=${shipping/100:.2f}, tax=${tax/100:.2f})")
+    checkout_log.info(
+        "Final total: ${total:.2f} (discount=${discount:.2f}, shipping=${shipping:.2f}, tax=${tax:.2f})",
+        total=total / 100,
+        discount=discount / 100,
+        shipping=shipping / 100,
+        tax=tax / 100,
+    )
 
-    ok, auth_id = await payment_charge(payload.payment_token or "tok_demo", total, x_scenario)
+    ok, auth_id = await within(payment_charge(payload.payment_token or "tok_demo", total, x_scenario), "payment")
 
     # simulate slow email
-    logger.warning("Sending confirmation email synchronously - blocking the response for 1 second!")
+    checkout_log.warning("Sending confirmation email synchronously - blocking the response for 1 second!")
     import asyncio
-    await asyncio.sleep(1.0)  # 1 second email send blocking the response
+    await within(asyncio.sleep(1.0), "email")  # 1 second email send blocking the response
 
     trace_id = sentry_sdk.get_current_scope().transaction and sentry_sdk.get_current_scope().transaction.trace_id
     
-    logger.info(f"Checkout completed successfully for {payload.user_email}, order_id=1, trace_id={trace_id}")
+    checkout_log.info(
+        "Checkout completed successfully for {email}, order_id=1, trace_id={trace_id}",
+        email=payload.user_email,
+        trace_id=trace_id,
+    )
 
     return CheckoutOut(order_id=1, total_cents=total, status="confirmed", trace_id=trace_id)
@@ -1,21 +1,52 @@
 from __future__ import annotations
 
-from typing import List, Optional
+import asyncio
+import os
+import time
+import zlib
+from typing import AsyncIterator, Dict, List, Optional, Union
 
 import sentry_sdk
-from sentry_sdk import logger
-from fastapi import APIRouter, Depends, Header, Query
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import lifespan_session
-from ..models import Product
-from ..schemas import CheckoutIn, CheckoutOut, ProductOut
-from ..services.external import payment_charge, shipping_quote, tax_compute
-from ..services.inventory import get_inventory_for_products_aggregated
-from ..services.pricing import apply_coupon_fast
+from ..consistency import REPLICA_LAG_TOLERANCE_SECONDS, mark_recent_write, needs_primary
+from ..db import READ_DATABASE_URL, lifespan_read_session, lifespan_session
+from ..deadline import Deadline, DeadlineExceeded, checkout_deadline, current_deadline, within
+from ..log import get_logger
+from ..models import Order, OrderItem, Product
+from ..pagination import decode_cursor, encode_cursor
+from ..resilience import DependencyUnavailable
+from ..schemas import CartIn, CartQuoteOut, CatalogPageOut, CheckoutIn, CheckoutOut, ProductDetailOut, ProductOut
+from ..serialization import RawJSONResponse, dumps
+from ..services.catalog import (
+    CATALOG_COLUMNS,
+    catalog_cache,
+    load_product_detail,
+    product_cache,
+    product_flight,
+    resolve_category_id,
+)
+from ..services.external import payment_charge_guarded, shipping_quote_cached, tax_compute
+from ..services.inventory import (
+    InsufficientStock,
+    get_inventory_for_products_aggregated,
+    record_movements,
+    reserve_stock,
+)
+from ..services.outbox import enqueue
+from ..services.pricing import apply_coupon_fast, coupon_index
+from ..services.search import search_product_ids
+from ..services.users import get_or_create_user_id
 
 router = APIRouter(prefix="/api/v2")
+catalog_log = get_logger("v2.catalog")
+checkout_log = get_logger("v2.checkout")
+
+EXPORT_CHUNK_SIZE = int(os.getenv("CATALOG_EXPORT_CHUNK_SIZE", "1000"))
+CART_QUOTE_MAX_CARTS = int(os.getenv("CART_QUOTE_MAX_CARTS", "500"))
 
 
 async def get_session() -> AsyncSession:
@@ -23,71 +54,437 @@ async def get_session() -> AsyncSession:
         yield s
 
 
-@router.get("/catalog", response_model=List[ProductOut])
+async def get_read_session(request: Request) -> AsyncSession:
+    async with lifespan_read_session(primary=needs_primary(request)) as s:
+        yield s
+
+
+@router.get("/catalog", response_model=Union[CatalogPageOut, List[ProductOut]])
 async def catalog(
+    request: Request,
     category: Optional[str] = Query(default=None),
     include: Optional[str] = Query(default=None),
     limit: int = 20,
     offset: int = 0,
+    cursor: Optional[str] = Query(default=None),
     x_scenario: Optional[str] = Header(default=None, alias="X-Scenario"),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
-    logger.debug(f"Catalog request: include={include}, category={category}, limit={limit}, offset={offset}")
+    catalog_log.debug(
+        "Catalog request: include={include}, category={category}, limit={limit}, offset={offset}, cursor={cursor}",
+        include=include,
+        category=category,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
+
+    with_inventory = bool(include and "inventory" in include)
+    cache_key = (category, with_inventory, limit, offset if cursor is None else None, cursor)
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        catalog_log.debug("Catalog page served from cache")
+        return RawJSONResponse(cached)
+    # Captured before reading so a page that raced with a write is not cached.
+    generation = catalog_cache.generation
     
-    q = select(Product)
+    # Fast path: column rows straight to JSON bytes. No ORM identity map, and
+    # returning a Response skips FastAPI's response_model re-validation; the
+    # bytes match what the ProductOut/CatalogPageOut models would produce.
+    q = select(*CATALOG_COLUMNS).order_by(Product.id)
     if category:
-        q = q.where(Product.slug.like(f"{category}-%"))
-        logger.info(f"Filtering products by category: {category}")
-        
-    products = (await session.execute(q.offset(offset).limit(limit))).scalars().all()
+        # (category_id, id) index: the filter and the id ordering/cursor are one range scan
+        category_id = await resolve_category_id(session, category)
+        if category_id is None:
+            catalog_log.info("Unknown category: {category}", category=category)
+            return RawJSONResponse(dumps({"items": [], "next_cursor": None} if cursor is not None else []))
+        q = q.where(Product.category_id == category_id)
+        catalog_log.info("Filtering products by category: {category} (id={category_id})", category=category, category_id=category_id)
+
+    # Passing `cursor` (empty for the first page) opts into keyset pagination:
+    # every page is an index range scan from the last seen id, however deep.
+    # Without it, old clients keep the offset mode and a bare list response.
+    keyset = cursor is not None
+    if keyset:
+        after = decode_cursor(cursor)
+        if after is not None:
+            q = q.where(Product.id > after)
+        rows = (await session.execute(q.limit(limit + 1))).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        rows = (await session.execute(q.offset(offset).limit(limit))).all()
     
-    logger.info(f"Found {len(products)} products")
+    catalog_log.info("Found {count} products", count=len(rows))
     
-    ids = [p.id for p in products]
-    if include and "inventory" in include:
-        logger.info("Using optimized aggregated inventory query for all products at once")
-    inventory_map = await get_inventory_for_products_aggregated(session, ids)
-    result: List[ProductOut] = []
-    for p in products:
-        inv = inventory_map.get(p.id, 0) if (include and "inventory" in include) else None
-        result.append(ProductOut.model_validate({**p.__dict__, "inventory": inv}))
-    return result
+    ids = [r.id for r in rows]
+    inventory_map: Dict[int, int] = {}
+    if with_inventory:
+        catalog_log.info("Using optimized aggregated inventory query for all products at once")
+        inventory_map = await get_inventory_for_products_aggregated(session, ids)
+    items = [
+        {
+            "id": r.id,
+            "name": r.name,
+            "slug": r.slug,
+            "category_id": r.category_id,
+            "price_cents": r.price_cents,
+            "image_url": r.image_url,
+            "inventory": inventory_map.get(r.id, 0) if with_inventory else None,
+        }
+        for r in rows
+    ]
+    if keyset:
+        next_cursor = encode_cursor(rows[-1].id) if has_more and rows else None
+        page = dumps({"items": items, "next_cursor": next_cursor})
+    else:
+        page = dumps(items)
+    # A replica read just after a write may predate it; don't pin that in the cache.
+    replica_may_lag = (
+        READ_DATABASE_URL is not None
+        and not needs_primary(request)
+        and time.monotonic() - catalog_cache.invalidated_at < REPLICA_LAG_TOLERANCE_SECONDS
+    )
+    if not replica_may_lag:
+        catalog_cache.set(cache_key, page, tags=ids, generation=generation)
+    return RawJSONResponse(page)
+
+
+@router.get("/catalog/export")
+async def catalog_export(
+    request: Request,
+    category: Optional[str] = Query(default=None),
+    chunk_size: int = Query(default=EXPORT_CHUNK_SIZE, ge=1, le=10000),
+):
+    """Whole catalog with stock as NDJSON, streamed chunk by chunk (gzip if the client accepts it).
+
+    Products are read in keyset chunks on id, each joined to its balances in one
+    query, so memory is bounded by ``chunk_size`` and the first line goes out
+    after the first chunk rather than after the whole catalog.
+    """
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    primary = needs_primary(request)
+
+    async def lines() -> AsyncIterator[bytes]:
+        # The stream outlives the request's dependencies, so it owns its session.
+        async with lifespan_read_session(primary=primary) as session:
+            q = select(*CATALOG_COLUMNS).order_by(Product.id)
+            if category:
+                category_id = await resolve_category_id(session, category)
+                if category_id is None:
+                    return
+                q = q.where(Product.category_id == category_id)
+            after = 0
+            while True:
+                rows = (await session.execute(q.where(Product.id > after).limit(chunk_size))).all()
+                if not rows:
+                    return
+                inventory_map = await get_inventory_for_products_aggregated(session, [r.id for r in rows])
+                # end the read transaction so a slow client doesn't pin a pooled connection
+                await session.commit()
+                yield b"".join(
+                    dumps(
+                        {
+                            "id": r.id,
+                            "name": r.name,
+                            "slug": r.slug,
+                            "category_id": r.category_id,
+                            "price_cents": r.price_cents,
+                            "image_url": r.image_url,
+                            "inventory": inventory_map.get(r.id, 0),
+                        }
+                    )
+                    + b"\n"
+                    for r in rows
+                )
+                after = rows[-1].id
+
+    async def gzipped(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        async for chunk in chunks:
+            # sync flush: every chunk reaches the client now instead of waiting in the compressor
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+    headers = {"Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        gzipped(lines()) if gzip else lines(),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
+@router.get("/search", response_model=CatalogPageOut)
+async def search(
+    q: str = Query(min_length=1, max_length=100),
+    include: Optional[str] = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: Optional[str] = Query(default=None),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Products whose name has words starting with every term in ``q`` (type-ahead), keyset paged by id.
+
+    Matching runs on the search index (FTS5 on SQLite, a tsvector GIN index on Postgres);
+    only the page of ids it returns is then loaded.
+    """
+    ids = await search_product_ids(session, q, decode_cursor(cursor), limit + 1)
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+    items = []
+    if ids:
+        rows = (await session.execute(select(*CATALOG_COLUMNS).where(Product.id.in_(ids)).order_by(Product.id))).all()
+        with_inventory = bool(include and "inventory" in include)
+        inventory_map = await get_inventory_for_products_aggregated(session, ids) if with_inventory else {}
+        items = [
+            {
+                "id": r.id,
+                "name": r.name,
+                "slug": r.slug,
+                "category_id": r.category_id,
+                "price_cents": r.price_cents,
+                "image_url": r.image_url,
+                "inventory": inventory_map.get(r.id, 0) if with_inventory else None,
+            }
+            for r in rows
+        ]
+    next_cursor = encode_cursor(ids[-1]) if has_more else None
+    return RawJSONResponse(dumps({"items": items, "next_cursor": next_cursor}))
+
+
+@router.get("/products/{slug}", response_model=ProductDetailOut)
+async def product_detail(slug: str, request: Request):
+    """One product with its category and current stock, served from the hot-key cache."""
+    cached = product_cache.get(slug)
+    if cached is not None:
+        return RawJSONResponse(cached)
+    primary = needs_primary(request)
+
+    async def load() -> Optional[bytes]:
+        # Runs once for every concurrent miss on this slug and may outlive the
+        # request that started it, so it owns its session.
+        generation = product_cache.generation
+        async with lifespan_read_session(primary=primary) as session:
+            product = await load_product_detail(session, slug)
+        if product is None:
+            return None
+        body = dumps(product)
+        replica_may_lag = (
+            READ_DATABASE_URL is not None
+            and not primary
+            and time.monotonic() - product_cache.invalidated_at < REPLICA_LAG_TOLERANCE_SECONDS
+        )
+        if not replica_may_lag:
+            product_cache.set(slug, body, tags=[product["id"]], generation=generation)
+        return body
+
+    body = await product_flight.do((slug, primary), load)
+    if body is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"error": "product_not_found", "message": f"No product with slug '{slug}'", "slug": slug},
+        )
+    return RawJSONResponse(body)
+
+
+@router.post("/cart/quote", response_model=Union[CartQuoteOut, List[CartQuoteOut]])
+async def cart_quote(
+    payload: Union[CartIn, List[CartIn]],
+    x_scenario: Optional[str] = Header(default=None, alias="X-Scenario"),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Price one cart (object in, object out) or many (list in, list out) without placing an order.
+
+    Products and stock for every cart come from two batched queries, then each
+    cart's coupon, shipping and tax are computed concurrently. Nothing is
+    reserved or charged, so the quote is a preview: checkout re-checks stock.
+    """
+    carts = payload if isinstance(payload, list) else [payload]
+    if len(carts) > CART_QUOTE_MAX_CARTS:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "too_many_carts", "message": f"At most {CART_QUOTE_MAX_CARTS} carts per request"},
+        )
+
+    product_ids = sorted({item.product_id for cart in carts for item in cart.items})
+    prod_map = {}
+    if product_ids:
+        rows = await session.execute(
+            select(Product.id, Product.category_id, Product.price_cents).where(Product.id.in_(product_ids))
+        )
+        prod_map = {r.id: r for r in rows}
+    stock = await get_inventory_for_products_aggregated(session, list(prod_map))
+    # Load coupons once up front, so the concurrent quotes below never touch the session.
+    await coupon_index.refresh(session)
+
+    async def quote(cart: CartIn) -> CartQuoteOut:
+        quantities: Dict[int, int] = {}
+        for item in cart.items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        known = {pid: qty for pid, qty in quantities.items() if pid in prod_map}
+        lines = [(prod_map[pid].category_id, prod_map[pid].price_cents * qty) for pid, qty in known.items()]
+        subtotal = sum(line_cents for _, line_cents in lines)
+        discount, shipping, tax = await asyncio.gather(
+            apply_coupon_fast(session, subtotal, cart.coupon_code, lines),
+            shipping_quote_cached(cart.address or "", subtotal, x_scenario),
+            tax_compute(cart.address or "", subtotal),
+        )
+        return CartQuoteOut(
+            subtotal_cents=subtotal,
+            discount_cents=discount,
+            shipping_cents=shipping,
+            tax_cents=tax,
+            total_cents=subtotal - discount + shipping + tax,
+            unknown_product_ids=sorted(pid for pid in quantities if pid not in prod_map),
+            insufficient_product_ids=sorted(pid for pid, qty in known.items() if stock.get(pid, 0) < qty),
+        )
+
+    quotes = await asyncio.gather(*(quote(cart) for cart in carts))
+    return quotes if isinstance(payload, list) else quotes[0]
+
+
+async def _release_order(session: AsyncSession, order: Order, quantities: Dict[int, int], status: str) -> None:
+    # give the reserved stock back; the ledger keeps both movements
+    await record_movements(session, [{"product_id": pid, "delta": qty} for pid, qty in quantities.items()])
+    order.status = status
+    await session.commit()
 
 
 @router.post("/checkout", response_model=CheckoutOut)
 async def checkout(
     payload: CheckoutIn,
+    response: Response,
     x_scenario: Optional[str] = Header(default=None, alias="X-Scenario"),
+    deadline: Deadline = Depends(checkout_deadline),
     session: AsyncSession = Depends(get_session),
 ):
-    # parallelize IO
-    subtotal = 0
-    product_ids = [i.product_id for i in payload.items]
-    products = (await session.execute(select(Product).where(Product.id.in_(product_ids)))).scalars().all()
+    # Every stage below (and the external calls they make) runs on what is left of this budget.
+    current_deadline.set(deadline)
+    product_ids = sorted({i.product_id for i in payload.items})
+    # Plain column rows, not entities: a rollback on the stock-out path would
+    # expire entities, and reading them afterwards would lazy-load outside the greenlet.
+    products = (
+        await within(
+            session.execute(
+                select(Product.id, Product.name, Product.category_id, Product.price_cents).where(
+                    Product.id.in_(product_ids)
+                )
+            ),
+            "load_products",
+        )
+    ).all()
     prod_map = {p.id: p for p in products}
+    missing = [pid for pid in product_ids if pid not in prod_map]
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "unknown_product", "message": f"Unknown product ids: {missing}", "product_ids": missing},
+        )
 
-    # reserve inventory quickly (simulated)
-    inventory_map = await get_inventory_for_products_aggregated(session, product_ids)
+    quantities: Dict[int, int] = {}
     for item in payload.items:
-        if inventory_map.get(item.product_id, 0) < item.quantity:
-            raise ValueError("Out of stock")
-        subtotal += prod_map[item.product_id].price_cents * item.quantity
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    lines = [(prod_map[pid].category_id, prod_map[pid].price_cents * qty) for pid, qty in quantities.items()]
+    subtotal = sum(line_cents for _, line_cents in lines)
 
-    discount_task = apply_coupon_fast(session, subtotal, payload.coupon_code)
-    shipping_task = shipping_quote(payload.address or "", subtotal, x_scenario)
+    # parallelize IO
+    discount_task = apply_coupon_fast(session, subtotal, payload.coupon_code, lines)
+    shipping_task = shipping_quote_cached(payload.address or "", subtotal, x_scenario)
     tax_task = tax_compute(payload.address or "", subtotal)
 
-    import asyncio
-
-    discount, shipping, tax = await asyncio.gather(discount_task, shipping_task, tax_task)
+    discount, shipping, tax = await within(asyncio.gather(discount_task, shipping_task, tax_task), "pricing")
 
     total = subtotal - discount + shipping + tax
 
-    ok, auth_id = await payment_charge(payload.payment_token or "tok_demo", total, x_scenario)
+    # Order, items and stock reservation commit together; statement count is
+    # constant in the cart size and the guarded decrement cannot oversell.
+    async def place_order() -> Order:
+        user_id = await get_or_create_user_id(session, payload.user_email)
+        order = Order(
+            user_id=user_id,
+            subtotal_cents=subtotal,
+            discount_cents=discount,
+            shipping_cents=shipping,
+            tax_cents=tax,
+            total_cents=total,
+            status="reserved",
+        )
+        session.add(order)
+        await session.flush()
+        await session.execute(
+            insert(OrderItem),
+            [
+                {
+                    "order_id": order.id,
+                    "product_id": pid,
+                    "quantity": qty,
+                    "unit_price_cents": prod_map[pid].price_cents,
+                }
+                for pid, qty in quantities.items()
+            ],
+        )
+        await reserve_stock(session, quantities)
+        await session.commit()
+        return order
+
+    try:
+        order = await within(place_order(), "reserve_inventory")
+    except DeadlineExceeded:
+        await session.rollback()
+        raise
+    except InsufficientStock as exc:
+        await session.rollback()
+        available = await get_inventory_for_products_aggregated(session, exc.product_ids)
+        pid = exc.product_ids[0]
+        checkout_log.warning("Checkout rejected, insufficient inventory for products {product_ids}", product_ids=exc.product_ids)
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "error": "insufficient_inventory",
+                "message": f"Product '{prod_map[pid].name}' is out of stock. Requested: {quantities[pid]}, Available: {available.get(pid, 0)}",
+                "product_id": pid,
+                "product_name": prod_map[pid].name,
+                "requested_quantity": quantities[pid],
+                "available_quantity": available.get(pid, 0),
+            },
+        )
 
-    # email offloaded (simulated quick enqueue)
-    pass
+    try:
+        # never hedged: a second in-flight request would be a second charge
+        ok, auth_id = await within(
+            payment_charge_guarded(
+                payload.payment_token or "tok_demo", total, x_scenario, idempotency_key=f"order-{order.id}"
+            ),
+            "payment",
+        )
+    except DeadlineExceeded:
+        # the idempotency key lets a charge that did land be reconciled against this order
+        await _release_order(session, order, quantities, "payment_timeout")
+        raise
+    except DependencyUnavailable:
+        await _release_order(session, order, quantities, "payment_unavailable")
+        raise HTTPException(
+            status_code=503,
+            detail={"error": "payment_unavailable", "message": "Payments are temporarily unavailable", "order_id": order.id},
+        )
+    if not ok:
+        await _release_order(session, order, quantities, "payment_failed")
+        raise HTTPException(
+            status_code=402,
+            detail={"error": "payment_failed", "message": "Payment was declined", "order_id": order.id},
+        )
+    order.status = "confirmed"
+    # committed with the confirmation so the email is neither lost nor sent for an unpaid order
+    enqueue(
+        session,
+        "order_confirmation_email",
+        {"order_id": order.id, "email": payload.user_email, "total_cents": total},
+    )
+    await session.commit()
+    # this client's next catalog reads go to the primary until the replica catches up
+    mark_recent_write(response)
 
     trace_id = sentry_sdk.get_current_scope().transaction and sentry_sdk.get_current_scope().transaction.trace_id
 
-    return CheckoutOut(order_id=1, total_cents=total, status="confirmed", trace_id=trace_id)
+    return CheckoutOut(order_id=order.id, total_cents=total, status=order.status, trace_id=trace_id)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+# Longest matching path prefix wins; anything unmatched uses SENTRY_TRACES_SAMPLE_RATE.
+DEFAULT_ROUTE_RATES = "/api/v1/checkout=1.0,/api/v2/checkout=1.0,/api/v1/catalog=0.01,/api/v2/catalog=0.01,/metrics=0"
+
+
+def parse_route_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        if "=" in part:
+            prefix, rate = part.split("=", 1)
+            rates[prefix.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class AdaptiveSampler:
+    """Sentry ``traces_sampler``: per-route base rates scaled down to a traces-per-second budget.
+
+    It tracks how many traces the base rates would produce over the last
+    ``window_seconds`` and, when that exceeds ``target_per_second``, scales every
+    route by the same factor so relative coverage is kept while volume is capped.
+    Incoming traces that already carry a sampling decision keep it.
+    """
+
+    def __init__(
+        self,
+        route_rates: Dict[str, float],
+        default_rate: float,
+        target_per_second: Optional[float],
+        window_seconds: float = 10.0,
+    ) -> None:
+        self.route_rates = sorted(route_rates.items(), key=lambda kv: len(kv[0]), reverse=True)
+        self.default_rate = default_rate
+        self.target_per_second = target_per_second
+        self.window_seconds = window_seconds
+        self._expected: Deque[Tuple[float, float]] = deque()
+        self._expected_sum = 0.0
+
+    def base_rate(self, path: str) -> float:
+        for prefix, rate in self.route_rates:
+            if path.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    def budget_factor(self, now: float) -> float:
+        if not self.target_per_second:
+            return 1.0
+        cutoff = now - self.window_seconds
+        while self._expected and self._expected[0][0] < cutoff:
+            self._expected_sum -= self._expected.popleft()[1]
+        expected_per_second = self._expected_sum / self.window_seconds
+        if expected_per_second <= self.target_per_second:
+            return 1.0
+        return self.target_per_second / expected_per_second
+
+    def __call__(self, sampling_context: Dict[str, Any]) -> float:
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return 1.0 if parent_sampled else 0.0
+        scope = sampling_context.get("asgi_scope") or {}
+        rate = self.base_rate(scope.get("path", ""))
+        if rate <= 0.0:
+            return 0.0
+        if not self.target_per_second:
+            # no budget: nothing to scale, so don't record (the window is only trimmed under a budget)
+            return rate
+        now = time.monotonic()
+        self._expected.append((now, rate))
+        self._expected_sum += rate
+        return rate * self.budget_factor(now)
+
+
+def sampler_from_env() -> AdaptiveSampler:
+    budget = os.getenv("SENTRY_TRACES_PER_SECOND", "10")
+    return AdaptiveSampler(
+        route_rates=parse_route_rates(os.getenv("SENTRY_ROUTE_SAMPLE_RATES", DEFAULT_ROUTE_RATES)),
+        default_rate=float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", "0.1")),
+        target_per_second=float(budget) if budget else None,
+    )
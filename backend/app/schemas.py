@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class ProductOut(BaseModel):
@@ -19,19 +19,50 @@ class ProductOut(BaseModel):
         from_attributes = True
 
 
+class CategoryOut(BaseModel):
+    id: int
+    name: str
+    slug: str
+
+
+class ProductDetailOut(ProductOut):
+    category: CategoryOut
+
+
+class CatalogPageOut(BaseModel):
+    items: List[ProductOut]
+    next_cursor: Optional[str] = None
+
+
 class CartItemIn(BaseModel):
     product_id: int
-    quantity: int
+    quantity: int = Field(gt=0)
 
 
 class CheckoutIn(BaseModel):
     user_email: str
-    items: List[CartItemIn]
+    items: List[CartItemIn] = Field(min_length=1)
     coupon_code: Optional[str] = None
     address: Optional[str] = None
     payment_token: Optional[str] = None
 
 
+class CartIn(BaseModel):
+    items: List[CartItemIn]
+    coupon_code: Optional[str] = None
+    address: Optional[str] = None
+
+
+class CartQuoteOut(BaseModel):
+    subtotal_cents: int
+    discount_cents: int
+    shipping_cents: int
+    tax_cents: int
+    total_cents: int
+    unknown_product_ids: List[int] = []
+    insufficient_product_ids: List[int] = []
+
+
 class CheckoutOut(BaseModel):
     order_id: int
     total_cents: int
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # optional speedup: pip install -e "backend[speedups]"
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Encode to the same bytes FastAPI's JSONResponse would produce."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class RawJSONResponse(Response):
+    """JSON response whose body was already encoded with ``dumps``."""
+
+    media_type = "application/json"
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..cache import SingleFlight, TTLCache
+from ..models import Category, InventoryBalance, Product
+
+# Category slugs change rarely and the table is tiny, so the whole slug -> id
+# map is loaded once and reloaded only when a lookup misses.
+_category_ids: Dict[str, int] = {}
+
+# Rendered v2 catalog pages, tagged with the product ids they contain.
+catalog_cache = TTLCache(
+    maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "5")),
+)
+
+# Rendered product detail responses keyed by slug, tagged with the product id.
+# Sized to hold the long tail, not just the front page; LRU keeps hot products in.
+product_cache = TTLCache(
+    maxsize=int(os.getenv("PRODUCT_CACHE_SIZE", "20000")),
+    ttl=float(os.getenv("PRODUCT_CACHE_TTL_SECONDS", "60")),
+)
+# When a hot product's entry expires, concurrent misses share one load.
+product_flight = SingleFlight()
+
+_CHANGED_PRODUCTS = "catalog_changed_product_ids"
+_PRODUCTS_RESHAPED = "catalog_products_reshaped"
+
+
+# Exactly the ProductOut fields, in its order (inventory is appended): the
+# catalog selects these as plain rows and never hydrates Product entities.
+CATALOG_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.slug,
+    Product.category_id,
+    Product.price_cents,
+    Product.image_url,
+)
+
+
+async def _load_category_ids(session: AsyncSession) -> None:
+    rows = (await session.execute(select(Category.slug, Category.id))).all()
+    _category_ids.clear()
+    _category_ids.update({slug: cid for slug, cid in rows})
+
+
+async def resolve_category_id(session: AsyncSession, slug: str) -> Optional[int]:
+    """Map a category slug to its id, or None if no such category exists."""
+    cid = _category_ids.get(slug)
+    if cid is None:
+        await _load_category_ids(session)
+        cid = _category_ids.get(slug)
+    return cid
+
+
+def invalidate_category_ids() -> None:
+    _category_ids.clear()
+
+
+async def load_product_detail(session: AsyncSession, slug: str) -> Optional[Dict[str, Any]]:
+    """Product, its category and current stock in one query, or None if no product has ``slug``."""
+    row = (
+        await session.execute(
+            select(
+                *CATALOG_COLUMNS,
+                Category.name.label("category_name"),
+                Category.slug.label("category_slug"),
+                InventoryBalance.quantity,
+            )
+            .join(Category, Category.id == Product.category_id)
+            .outerjoin(InventoryBalance, InventoryBalance.product_id == Product.id)
+            .where(Product.slug == slug)
+            .order_by(Product.id)
+            .limit(1)
+        )
+    ).first()
+    if row is None:
+        return None
+    return {
+        "id": row.id,
+        "name": row.name,
+        "slug": row.slug,
+        "category_id": row.category_id,
+        "price_cents": row.price_cents,
+        "image_url": row.image_url,
+        "inventory": int(row.quantity or 0),
+        "category": {"id": row.category_id, "name": row.category_name, "slug": row.category_slug},
+    }
+
+
+def mark_products_changed(session: AsyncSession | Session, product_ids: Iterable[int]) -> None:
+    """Drop cached pages and product details for ``product_ids`` once ``session`` commits."""
+    session.info.setdefault(_CHANGED_PRODUCTS, set()).update(product_ids)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_product_changes(session: Session, flush_context, instances) -> None:
+    # Inserts and deletes shift every page boundary; updates only touch the
+    # pages that contain the product.
+    for obj in session.new | session.deleted:
+        if isinstance(obj, Product):
+            session.info[_PRODUCTS_RESHAPED] = True
+            return
+    changed = [obj.id for obj in session.dirty if isinstance(obj, Product) and session.is_modified(obj)]
+    if changed:
+        mark_products_changed(session, changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session: Session) -> None:
+    product_ids = session.info.pop(_CHANGED_PRODUCTS, None)
+    if session.info.pop(_PRODUCTS_RESHAPED, False):
+        catalog_cache.clear()
+        product_cache.clear()
+    elif product_ids:
+        catalog_cache.invalidate_tags(product_ids)
+        product_cache.invalidate_tags(product_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(_CHANGED_PRODUCTS, None)
+    session.info.pop(_PRODUCTS_RESHAPED, None)
@@ -3,7 +3,38 @@ from __future__ import annotations
 import asyncio
 import os
 import random
-from typing import Tuple
+from typing import Any, Dict, Tuple
+
+from ..cache import SingleFlight, TTLCache
+from ..deadline import DeadlineExceeded, current_deadline, within
+from ..resilience import CircuitBreaker, Dependency
+
+FREE_SHIPPING_THRESHOLD_CENTS = 5000
+HEDGE_PERCENTILE = float(os.getenv("EXTERNAL_HEDGE_PERCENTILE", "95"))
+BREAKER_FAILURE_RATIO = float(os.getenv("EXTERNAL_BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("EXTERNAL_BREAKER_OPEN_SECONDS", "10"))
+
+# Quotes are read-only, so they are always hedged; an open breaker falls back
+# to the flat-rate policy. Charges are never hedged: a duplicate request is a
+# second charge unless the gateway deduplicates on the idempotency key, and the
+# simulated one does not. They fail fast when the breaker is open.
+shipping_dependency = Dependency(
+    "shipping_quote",
+    CircuitBreaker(failure_ratio=BREAKER_FAILURE_RATIO, slow_call_ms=400, open_seconds=BREAKER_OPEN_SECONDS),
+    hedge_percentile=HEDGE_PERCENTILE,
+)
+payment_dependency = Dependency(
+    "payment_charge",
+    CircuitBreaker(failure_ratio=BREAKER_FAILURE_RATIO, slow_call_ms=500, open_seconds=BREAKER_OPEN_SECONDS),
+)
+
+# The quote only depends on the destination and which side of the free-shipping
+# threshold the subtotal falls on, so that is all the cache key carries.
+shipping_cache = TTLCache(
+    maxsize=int(os.getenv("SHIPPING_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SHIPPING_CACHE_TTL_SECONDS", "300")),
+)
+_shipping_flight = SingleFlight()
 
 
 async def shipping_quote(address: str, subtotal_cents: int, scenario: str | None = None) -> int:
@@ -14,7 +45,51 @@ async def shipping_quote(address: str, subtotal_cents: int, scenario: str | None
         base, jitter = 180, 220
     delay_ms = base + random.randint(0, jitter)
     await asyncio.sleep(delay_ms / 1000.0)
-    return 599 if subtotal_cents < 5000 else 0
+    return _flat_rate_quote(subtotal_cents)
+
+
+def _normalize_address(address: str) -> str:
+    return " ".join(address.lower().replace(",", " ").split())
+
+
+def _flat_rate_quote(subtotal_cents: int) -> int:
+    return 599 if subtotal_cents < FREE_SHIPPING_THRESHOLD_CENTS else 0
+
+
+async def shipping_quote_cached(address: str, subtotal_cents: int, scenario: str | None = None) -> int:
+    """``shipping_quote`` behind a TTL cache; concurrent misses for one key share a single upstream call.
+
+    Misses go through ``shipping_dependency`` (hedged, circuit-broken, flat-rate fallback).
+    The shared load runs without a deadline; each caller waits for it only as long
+    as its own deadline allows and falls back to the flat rate when that runs out.
+    """
+    key = (_normalize_address(address), subtotal_cents >= FREE_SHIPPING_THRESHOLD_CENTS)
+    cached = shipping_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def load() -> int:
+        # the task copied whichever caller started it; its deadline is not everyone's
+        current_deadline.set(None)
+        quote = await shipping_dependency.call(
+            lambda: shipping_quote(address, subtotal_cents, scenario),
+            fallback=lambda: _flat_rate_quote(subtotal_cents),
+        )
+        shipping_cache.set(key, quote)
+        return quote
+
+    try:
+        return await within(_shipping_flight.do(key, load), "shipping_quote")
+    except DeadlineExceeded:
+        return _flat_rate_quote(subtotal_cents)
+
+
+def shipping_cache_stats() -> Dict[str, Any]:
+    return {
+        **shipping_cache.stats(),
+        "upstream_calls": _shipping_flight.calls,
+        "coalesced": _shipping_flight.coalesced,
+    }
 
 
 async def tax_compute(address: str, subtotal_cents: int) -> int:
@@ -22,10 +97,38 @@ async def tax_compute(address: str, subtotal_cents: int) -> int:
     return int(subtotal_cents * 0.08)
 
 
-async def payment_charge(payment_token: str, total_cents: int, scenario: str | None = None) -> Tuple[bool, str]:
+async def payment_charge(
+    payment_token: str,
+    total_cents: int,
+    scenario: str | None = None,
+    idempotency_key: str | None = None,
+) -> Tuple[bool, str]:
+    # A real gateway returns the original result for a repeated idempotency_key
     base = 120
     jitter = 60
     if scenario == "BlackFriday":
         base, jitter = 240, 220
     await asyncio.sleep((base + random.randint(0, jitter)) / 1000.0)
     return True, "auth_" + str(random.randint(10000, 99999))
+
+
+async def send_email(to: str, subject: str, body: str) -> None:
+    # Simulated SMTP/provider round trip
+    await asyncio.sleep(1.0)
+
+
+async def payment_charge_guarded(
+    payment_token: str,
+    total_cents: int,
+    scenario: str | None = None,
+    idempotency_key: str | None = None,
+) -> Tuple[bool, str]:
+    """``payment_charge`` behind ``payment_dependency``; raises ``DependencyUnavailable`` when open."""
+    return await payment_dependency.call(
+        lambda: payment_charge(payment_token, total_cents, scenario, idempotency_key),
+        hedge=False,
+    )
+
+
+def dependency_stats() -> Dict[str, Any]:
+    return {d.name: d.stats() for d in (shipping_dependency, payment_dependency)}
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from datetime import datetime
+from typing import Dict, Iterable, List, Mapping, Tuple
 
-from sqlalchemy import Select, func, select
+from sqlalchemy import Row, Select, case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..models import InventoryMovement
+from ..models import InventoryBalance, InventoryMovement
+from .catalog import mark_products_changed
 
 
 async def get_inventory_for_product_naive(session: AsyncSession, product_id: int) -> int:
@@ -13,7 +16,7 @@ async def get_inventory_for_product_naive(session: AsyncSession, product_id: int
     # Simulate network latency for remote database
     import asyncio
     await asyncio.sleep(0.05)  # 50ms simulated DB latency
-    
+
     movements = (await session.execute(select(InventoryMovement).where(InventoryMovement.product_id == product_id))).scalars().all()
     total = 0
     for m in movements:
@@ -22,12 +25,223 @@ async def get_inventory_for_product_naive(session: AsyncSession, product_id: int
 
 
 async def get_inventory_for_products_aggregated(session: AsyncSession, product_ids: List[int]) -> Dict[int, int]:
+    # Primary-key lookups on the maintained balance table: cost scales with the
+    # page, not with the size of the movement ledger.
     if not product_ids:
         return {}
-    stmt: Select = (
-        select(InventoryMovement.product_id, func.sum(InventoryMovement.delta))
-        .where(InventoryMovement.product_id.in_(product_ids))
-        .group_by(InventoryMovement.product_id)
+    stmt: Select = select(InventoryBalance.product_id, InventoryBalance.quantity).where(
+        InventoryBalance.product_id.in_(product_ids)
     )
     rows = await session.execute(stmt)
-    return {pid: int(total or 0) for pid, total in rows.all()}
+    return {pid: int(qty or 0) for pid, qty in rows.all()}
+
+
+def _upsert(session: AsyncSession):
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(InventoryBalance)
+    if dialect == "sqlite":
+        return sqlite.insert(InventoryBalance)
+    raise NotImplementedError(f"inventory balances are not supported on {dialect}")
+
+
+async def apply_to_balances(session: AsyncSession, deltas: Mapping[int, Tuple[int, int]]) -> None:
+    """Fold ``{product_id: (delta, last_movement_id)}`` into the balance table."""
+    if not deltas:
+        return
+    stmt = _upsert(session)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[InventoryBalance.product_id],
+        set_={
+            "quantity": InventoryBalance.quantity + stmt.excluded.quantity,
+            "last_movement_id": case(
+                (stmt.excluded.last_movement_id > InventoryBalance.last_movement_id, stmt.excluded.last_movement_id),
+                else_=InventoryBalance.last_movement_id,
+            ),
+            "updated_at": func.now(),
+        },
+    )
+    await session.execute(
+        stmt,
+        [
+            {"product_id": pid, "quantity": delta, "last_movement_id": last_id}
+            for pid, (delta, last_id) in sorted(deltas.items())
+        ],
+    )
+
+
+async def record_movements(session: AsyncSession, movements: Iterable[Mapping]) -> List[int]:
+    """Insert ledger rows and update the matching balances in the same transaction.
+
+    Every code path that writes ``InventoryMovement`` should go through here so the
+    balance table never drifts from the ledger. The caller owns the commit.
+    """
+    movements = list(movements)
+    if not movements:
+        return []
+    ids = (
+        await session.execute(
+            insert(InventoryMovement).returning(InventoryMovement.id, sort_by_parameter_order=True),
+            movements,
+        )
+    ).scalars().all()
+
+    deltas: Dict[int, Tuple[int, int]] = {}
+    for m_id, m in zip(ids, movements):
+        total, last_id = deltas.get(m["product_id"], (0, 0))
+        deltas[m["product_id"]] = (total + m["delta"], max(last_id, m_id))
+    await apply_to_balances(session, deltas)
+    mark_products_changed(session, deltas)
+    return list(ids)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids: List[int]) -> None:
+        super().__init__(f"insufficient stock for products {product_ids}")
+        self.product_ids = product_ids
+
+
+async def reserve_stock(session: AsyncSession, quantities: Mapping[int, int]) -> List[int]:
+    """Take ``{product_id: quantity}`` out of stock in two statements, whatever the cart size.
+
+    The negative ledger rows are bulk-inserted, then one conditional UPDATE
+    decrements every balance that still covers its quantity. If any product is
+    short, ``InsufficientStock`` is raised and the caller must roll back, which
+    also discards the ledger rows. Row locks taken by the UPDATE make concurrent
+    reservations of the same SKU queue up and re-check the guard, so stock never
+    goes negative. The caller owns the commit.
+    """
+    if not quantities:
+        return []
+    bad = sorted(pid for pid, qty in quantities.items() if qty <= 0)
+    if bad:
+        raise ValueError(f"non-positive reserve quantities for products {bad}")
+    pids = sorted(quantities)
+    ids = (
+        await session.execute(
+            insert(InventoryMovement).returning(InventoryMovement.id, sort_by_parameter_order=True),
+            [{"product_id": pid, "delta": -quantities[pid]} for pid in pids],
+        )
+    ).scalars().all()
+
+    wanted = case(quantities, value=InventoryBalance.product_id)
+    stmt = (
+        update(InventoryBalance)
+        .where(InventoryBalance.product_id.in_(pids), InventoryBalance.quantity >= wanted)
+        .values(
+            quantity=InventoryBalance.quantity - wanted,
+            last_movement_id=case(dict(zip(pids, ids)), value=InventoryBalance.product_id),
+            updated_at=func.now(),
+        )
+        .returning(InventoryBalance.product_id)
+        .execution_options(synchronize_session=False)
+    )
+    reserved = set((await session.execute(stmt)).scalars().all())
+    if len(reserved) < len(pids):
+        raise InsufficientStock([pid for pid in pids if pid not in reserved])
+    mark_products_changed(session, pids)
+    return list(ids)
+
+
+async def rebuild_inventory_balances(session: AsyncSession) -> int:
+    """Recompute every balance from the full ledger. Returns the number of products."""
+    await session.execute(delete(InventoryBalance))
+    agg = select(
+        InventoryMovement.product_id,
+        func.sum(InventoryMovement.delta),
+        func.max(InventoryMovement.id),
+    ).group_by(InventoryMovement.product_id)
+    await session.execute(
+        insert(InventoryBalance).from_select(["product_id", "quantity", "last_movement_id"], agg)
+    )
+    return int((await session.execute(select(func.count()).select_from(InventoryBalance))).scalar_one())
+
+
+async def verify_inventory_balances(session: AsyncSession) -> List[Tuple[int, int, int]]:
+    """Compare balances to the ledger; returns ``(product_id, balance, ledger)`` mismatches."""
+    ledger = dict(
+        (
+            await session.execute(
+                select(InventoryMovement.product_id, func.sum(InventoryMovement.delta)).group_by(
+                    InventoryMovement.product_id
+                )
+            )
+        ).all()
+    )
+    balances = dict(
+        (await session.execute(select(InventoryBalance.product_id, InventoryBalance.quantity))).all()
+    )
+    mismatches = []
+    for pid in sorted(set(ledger) | set(balances)):
+        expected = int(ledger.get(pid) or 0)
+        actual = int(balances.get(pid) or 0)
+        if expected != actual:
+            mismatches.append((pid, actual, expected))
+    return mismatches
+
+
+async def compactable_products(session: AsyncSession, before: datetime) -> List[int]:
+    """Products with more than one ledger row older than ``before``."""
+    stmt = (
+        select(InventoryMovement.product_id)
+        .where(InventoryMovement.created_at < before)
+        .group_by(InventoryMovement.product_id)
+        .having(func.count() > 1)
+        .order_by(InventoryMovement.product_id)
+    )
+    return list((await session.execute(stmt)).scalars().all())
+
+
+async def compact_movements(session: AsyncSession, product_ids: List[int], before: datetime) -> List[Row]:
+    """Fold ledger rows older than ``before`` into one opening-balance row per product.
+
+    The opening deltas are summed from exactly the rows the DELETE returned, so
+    the ledger total per product is unchanged and balances keep their quantity;
+    only ``last_movement_id`` moves up to the new opening row. Returns the deleted
+    rows so the caller can archive them. The caller owns the commit.
+    """
+    if not product_ids:
+        return []
+    deleted = (
+        await session.execute(
+            delete(InventoryMovement)
+            .where(InventoryMovement.product_id.in_(product_ids), InventoryMovement.created_at < before)
+            .returning(
+                InventoryMovement.id,
+                InventoryMovement.product_id,
+                InventoryMovement.delta,
+                InventoryMovement.created_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    ).all()
+
+    openings: Dict[int, Tuple[int, datetime]] = {}
+    for row in deleted:
+        total, latest = openings.get(row.product_id, (0, row.created_at))
+        openings[row.product_id] = (total + row.delta, max(latest, row.created_at))
+    pids = sorted(openings)
+    ids = (
+        await session.execute(
+            insert(InventoryMovement).returning(InventoryMovement.id, sort_by_parameter_order=True),
+            [{"product_id": pid, "delta": openings[pid][0], "created_at": openings[pid][1]} for pid in pids],
+        )
+    ).scalars().all()
+    await session.execute(
+        update(InventoryBalance)
+        .where(InventoryBalance.product_id.in_(pids))
+        .values(last_movement_id=case(dict(zip(pids, ids)), value=InventoryBalance.product_id))
+        .execution_options(synchronize_session=False)
+    )
+    return deleted
+
+
+async def ensure_inventory_balances(session: AsyncSession) -> None:
+    """Backfill the balance table for databases created before it existed."""
+    has_balances = (await session.execute(select(InventoryBalance.product_id).limit(1))).first()
+    if has_balances:
+        return
+    has_ledger = (await session.execute(select(InventoryMovement.id).limit(1))).first()
+    if has_ledger:
+        await rebuild_inventory_balances(session)
+        await session.commit()
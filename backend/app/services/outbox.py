@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Mapping, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..log import get_logger
+from ..models import OutboxEvent
+from .external import send_email
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "0.5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# How long a claimed event is hidden from other workers before it is retried.
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+
+log = get_logger("outbox")
+
+Handler = Callable[[Mapping[str, Any]], Awaitable[None]]
+
+
+async def _send_order_confirmation(payload: Mapping[str, Any]) -> None:
+    await send_email(
+        payload["email"],
+        f"Skipline order #{payload['order_id']} confirmed",
+        f"Thanks for your order! Total: ${payload['total_cents'] / 100:.2f}",
+    )
+
+
+HANDLERS: Dict[str, Handler] = {
+    "order_confirmation_email": _send_order_confirmation,
+}
+
+
+def enqueue(session: AsyncSession, kind: str, payload: Mapping[str, Any]) -> OutboxEvent:
+    """Add an outbox event to ``session``; it is only visible to workers once the caller commits."""
+    if kind not in HANDLERS:
+        raise ValueError(f"no outbox handler for {kind!r}")
+    event = OutboxEvent(kind=kind, payload=json.dumps(payload), status="pending", available_at=datetime.utcnow())
+    session.add(event)
+    return event
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with full jitter: up to 1s, 2s, 4s, ... capped at 5 minutes."""
+    return random.uniform(0, min(300.0, 2.0 ** (attempts - 1)))
+
+
+class OutboxWorker:
+    """Drains the outbox in batches with a bounded pool of concurrent handlers.
+
+    Delivery is at-least-once: an event is marked done only after its handler
+    returns, and a claim that is never finished is retried when its lease lapses.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        concurrency: int = OUTBOX_WORKERS,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_seconds: float = OUTBOX_POLL_SECONDS,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.processed = 0
+        self.failed = 0
+        self.dead = 0
+        self._completions: Deque[float] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self.run(), name="outbox-worker")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                drained = await self.drain_once()
+            except Exception as exc:  # keep the loop alive across DB hiccups
+                log.error("Outbox drain failed: {error}", error=str(exc))
+                drained = 0
+            if drained < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain_once(self) -> int:
+        """Claim and process one batch; returns the number of events claimed."""
+        events = await self._claim()
+        if not events:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(event: OutboxEvent) -> None:
+            async with semaphore:
+                await self._process(event)
+
+        await asyncio.gather(*(run_one(e) for e in events))
+        return len(events)
+
+    async def _claim(self) -> List[OutboxEvent]:
+        now = datetime.utcnow()
+        async with self.sessionmaker() as session:
+            events = (
+                await session.execute(
+                    select(OutboxEvent)
+                    .where(OutboxEvent.status == "pending", OutboxEvent.available_at <= now)
+                    .order_by(OutboxEvent.id)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+            ).scalars().all()
+            if not events:
+                return []
+            # The claim re-checks the pending/due condition and only rows it actually
+            # updated are ours: SQLite ignores FOR UPDATE SKIP LOCKED, so another worker
+            # may have selected the same rows, but only one UPDATE can move their lease.
+            claimed = set(
+                (
+                    await session.execute(
+                        update(OutboxEvent)
+                        .where(
+                            OutboxEvent.id.in_([e.id for e in events]),
+                            OutboxEvent.status == "pending",
+                            OutboxEvent.available_at <= now,
+                        )
+                        .values(
+                            attempts=OutboxEvent.attempts + 1,
+                            available_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                        )
+                        .returning(OutboxEvent.id)
+                        .execution_options(synchronize_session=False)
+                    )
+                ).scalars().all()
+            )
+            await session.commit()
+        events = [e for e in events if e.id in claimed]
+        for e in events:
+            e.attempts += 1
+        return events
+
+    async def _process(self, event: OutboxEvent) -> None:
+        values: Dict[str, Any]
+        try:
+            await HANDLERS[event.kind](json.loads(event.payload))
+        except Exception as exc:
+            self.failed += 1
+            if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+                self.dead += 1
+                log.error(
+                    "Outbox event {event_id} ({kind}) gave up after {attempts} attempts: {error}",
+                    event_id=event.id,
+                    kind=event.kind,
+                    attempts=event.attempts,
+                    error=str(exc),
+                )
+                values = {"status": "dead", "last_error": str(exc)[:500]}
+            else:
+                retry_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(event.attempts))
+                log.warning(
+                    "Outbox event {event_id} ({kind}) failed, retrying at {retry_at}: {error}",
+                    event_id=event.id,
+                    kind=event.kind,
+                    retry_at=retry_at.isoformat(),
+                    error=str(exc),
+                )
+                values = {"available_at": retry_at, "last_error": str(exc)[:500]}
+        else:
+            self.processed += 1
+            self._completions.append(time.monotonic())
+            values = {"status": "done", "processed_at": datetime.utcnow()}
+        async with self.sessionmaker() as session:
+            await session.execute(update(OutboxEvent).where(OutboxEvent.id == event.id).values(**values))
+            await session.commit()
+
+    def drain_rate(self, window_seconds: float = 60.0) -> float:
+        """Events completed per second over the last ``window_seconds``."""
+        cutoff = time.monotonic() - window_seconds
+        while self._completions and self._completions[0] < cutoff:
+            self._completions.popleft()
+        return round(len(self._completions) / window_seconds, 3)
+
+    async def metrics(self) -> Dict[str, Any]:
+        async with self.sessionmaker() as session:
+            by_status = dict(
+                (
+                    await session.execute(
+                        select(OutboxEvent.status, func.count()).group_by(OutboxEvent.status)
+                    )
+                ).all()
+            )
+        return {
+            "running": self._task is not None,
+            "concurrency": self.concurrency,
+            "batch_size": self.batch_size,
+            "depth": by_status.get("pending", 0),
+            "dead_letters": by_status.get("dead", 0),
+            "processed": self.processed,
+            "failed_attempts": self.failed,
+            "dead": self.dead,
+            "drain_rate_per_sec": self.drain_rate(),
+        }
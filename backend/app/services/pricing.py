@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from sqlalchemy import and_, select
+from sqlalchemy import event, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 from ..models import Coupon, Product
 
+COUPON_INDEX_REFRESH_SECONDS = float(os.getenv("COUPON_INDEX_REFRESH_SECONDS", "60"))
+
 
 async def apply_coupon_naive(session: AsyncSession, subtotal_cents: int, coupon_code: Optional[str]) -> int:
     if not coupon_code:
@@ -25,24 +32,113 @@ async def apply_coupon_naive(session: AsyncSession, subtotal_cents: int, coupon_
     return 0
 
 
+@dataclass(frozen=True)
+class CouponRule:
+    percent_off: int
+    starts_at: datetime
+    ends_at: datetime
+    min_subtotal_cents: int
+    applies_to_category_id: Optional[int]
+
+    def is_active(self, now: datetime, subtotal_cents: int) -> bool:
+        return self.starts_at <= now <= self.ends_at and subtotal_cents >= self.min_subtotal_cents
+
+
+class CouponIndex:
+    """In-memory coupons keyed by code, reloaded periodically or after a coupon write commits.
+
+    The table holds a few dozen rows, so the whole thing is reloaded at once and
+    validity is checked against each rule's interval at pricing time.
+    """
+
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self._rules: Dict[str, List[CouponRule]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_seconds
+
+    async def rules_for(self, session: AsyncSession, code: str) -> List[CouponRule]:
+        if not self._is_fresh():
+            await self.refresh(session)
+        return self._rules.get(code, [])
+
+    async def refresh(self, session: AsyncSession, force: bool = False) -> None:
+        async with self._lock:
+            if force or not self._is_fresh():
+                await self._load(session)
+
+    async def _load(self, session: AsyncSession) -> None:
+        coupons = (await session.execute(select(Coupon).order_by(Coupon.id))).scalars().all()
+        rules: Dict[str, List[CouponRule]] = {}
+        for c in coupons:
+            rules.setdefault(c.code, []).append(
+                CouponRule(
+                    percent_off=c.percent_off,
+                    starts_at=c.starts_at,
+                    ends_at=c.ends_at,
+                    min_subtotal_cents=c.min_subtotal_cents or 0,
+                    applies_to_category_id=c.applies_to_category_id,
+                )
+            )
+        self._rules = rules
+        self._loaded_at = time.monotonic()
+
+
+coupon_index = CouponIndex(COUPON_INDEX_REFRESH_SECONDS)
+
+_COUPONS_CHANGED = "coupons_changed"
+
+
+@event.listens_for(Session, "before_flush")
+def _track_coupon_changes(session: Session, flush_context, instances) -> None:
+    if any(isinstance(obj, Coupon) for obj in session.new | session.dirty | session.deleted):
+        session.info[_COUPONS_CHANGED] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _refresh_on_commit(session: Session) -> None:
+    if session.info.pop(_COUPONS_CHANGED, False):
+        coupon_index.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(_COUPONS_CHANGED, None)
+
+
 async def apply_coupon_fast(
     session: AsyncSession,
     subtotal_cents: int,
     coupon_code: Optional[str],
-    category_id: Optional[int] = None,
+    lines: Optional[Iterable[Tuple[int, int]]] = None,
 ) -> int:
+    """Discount for ``coupon_code`` priced per line from the in-memory coupon index.
+
+    ``lines`` are ``(category_id, line_total_cents)`` pairs; a category-scoped
+    coupon only discounts the lines in its category. Without ``lines`` the whole
+    subtotal is treated as one unscoped line.
+    """
     if not coupon_code:
         return 0
     now = datetime.utcnow()
-    stmt = select(Coupon).where(
-        and_(
-            Coupon.code == coupon_code,
-            Coupon.starts_at <= now,
-            Coupon.ends_at >= now,
-            Coupon.min_subtotal_cents <= subtotal_cents,
-        )
+    rule = next(
+        (r for r in await coupon_index.rules_for(session, coupon_code) if r.is_active(now, subtotal_cents)),
+        None,
     )
-    coupon = (await session.execute(stmt)).scalars().first()
-    if not coupon:
+    if not rule:
         return 0
-    return int(subtotal_cents * (coupon.percent_off / 100.0))
+    if lines is None:
+        if rule.applies_to_category_id is not None:
+            return 0
+        lines = [(None, subtotal_cents)]
+    return sum(
+        int(line_cents * (rule.percent_off / 100.0))
+        for category_id, line_cents in lines
+        if rule.applies_to_category_id is None or category_id == rule.applies_to_category_id
+    )
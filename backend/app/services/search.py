@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import re
+from typing import List, Optional
+
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Product
+
+# Type-ahead queries are short; extra tokens only narrow an already small result.
+MAX_TERMS = 8
+
+# Letters and digits; "_" separates words, as in FTS5's unicode61 and the tsvector parser.
+_TOKEN = re.compile(r"[^\W_]+")
+
+# External-content FTS5 table over products.name, kept in step by triggers, so
+# every write path (ORM, bulk inserts, scripts) updates it in the same transaction.
+_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE products_fts USING fts5(name, content='products', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END",
+    # index whatever was already in products
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+)
+
+# Word-prefix search on Postgres: a GIN index over the 'simple' (no stemming)
+# tsvector of the name. ``term:*`` prefix queries use it at any term length,
+# including the one- and two-letter prefixes of early type-ahead keystrokes.
+_POSTGRES_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_products_name_tsv ON products USING gin (to_tsvector('simple', name))",
+)
+# Must match the indexed expression exactly for the planner to use the index.
+_SIMPLE = literal_column("'simple'::regconfig")
+
+
+def search_terms(query: str) -> List[str]:
+    return [t.lower() for t in _TOKEN.findall(query)][:MAX_TERMS]
+
+
+def ensure_search_index(conn: Connection) -> None:
+    """Create the product name search index if it is missing (run with ``conn.run_sync``)."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+        ).first()
+        if not exists:
+            for statement in _SQLITE_DDL:
+                conn.execute(text(statement))
+    elif dialect == "postgresql":
+        for statement in _POSTGRES_DDL:
+            conn.execute(text(statement))
+
+
+async def search_product_ids(session: AsyncSession, query: str, after: Optional[int], limit: int) -> List[int]:
+    """Ids of products whose name has a word starting with every term, ascending, after ``after``."""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    after = after or 0
+    if session.get_bind().dialect.name == "sqlite":
+        # quoted prefix tokens, implicitly ANDed; rowid order is the FTS index's native order
+        match = " ".join(f'"{term}"*' for term in terms)
+        rows = await session.execute(
+            text(
+                "SELECT rowid FROM products_fts WHERE products_fts MATCH :match AND rowid > :after "
+                "ORDER BY rowid LIMIT :limit"
+            ),
+            {"match": match, "after": after, "limit": limit},
+        )
+        return [r[0] for r in rows]
+    prefixes = " & ".join(f"{term}:*" for term in terms)
+    stmt = (
+        select(Product.id)
+        .where(
+            func.to_tsvector(_SIMPLE, Product.name).bool_op("@@")(func.to_tsquery(_SIMPLE, prefixes)),
+            Product.id > after,
+        )
+        .order_by(Product.id)
+        .limit(limit)
+    )
+    return list((await session.execute(stmt)).scalars().all())
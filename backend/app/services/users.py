@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import User
+
+
+async def get_or_create_user_id(session: AsyncSession, email: str) -> int:
+    """Id of the user with ``email``, inserting the user if needed. The caller owns the commit."""
+    lookup = select(User.id).where(User.email == email)
+    user_id = (await session.execute(lookup)).scalar_one_or_none()
+    if user_id is not None:
+        return user_id
+    # Concurrent first checkouts for the same email must not trip the unique constraint.
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    await session.execute(insert(User).values(email=email).on_conflict_do_nothing(index_elements=[User.email]))
+    return (await session.execute(lookup)).scalar_one()
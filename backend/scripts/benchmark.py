@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Load/benchmark harness for Skipline backend.
+Drives the v1 and v2 catalog and checkout endpoints, in-process through the ASGI
+app (fresh seeded SQLite database) or against a running server, and reports
+throughput and latency percentiles as JSON. With --baseline it fails when a
+scenario regressed past --max-regression, so hot-path slowdowns are caught before deploy.
+Catalog requests walk random offsets, so they measure queries rather than cache hits.
+Only the JSON report goes to stdout; setup and seeding progress go to stderr.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+
+SCENARIOS = {
+    "v1_catalog": ("GET", "/api/v1/catalog?limit=20", None),
+    "v2_catalog": ("GET", "/api/v2/catalog?include=inventory&limit=20", None),
+    "v1_checkout": ("POST", "/api/v1/checkout", None),
+    "v2_checkout": ("POST", "/api/v2/checkout", None),
+    # alternating catalog reads and checkout writes: shows reader/writer contention
+    "v2_mixed": ("MIXED", "/api/v2", None),
+    "v1_catalog_blackfriday": ("GET", "/api/v1/catalog?limit=20", "BlackFriday"),
+    "v2_catalog_blackfriday": ("GET", "/api/v2/catalog?include=inventory&limit=20", "BlackFriday"),
+    "v1_checkout_blackfriday": ("POST", "/api/v1/checkout", "BlackFriday"),
+    "v2_checkout_blackfriday": ("POST", "/api/v2/checkout", "BlackFriday"),
+}
+CATALOG_PAGE = 20
+
+
+def percentile(ordered: List[float], p: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))], 2)
+
+
+def checkout_body(num_products: int) -> Dict[str, Any]:
+    return {
+        "user_email": f"bench{random.randint(1, 50)}@skipline.app",
+        "items": [
+            {"product_id": random.randint(1, num_products), "quantity": 1}
+            for _ in range(random.randint(1, 3))
+        ],
+        "coupon_code": random.choice([None, "SAVE10"]),
+        "address": random.choice(["1 Main St, Springfield", "500 Market St, San Francisco", "10 Downing St, London"]),
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, name: str, requests: int, concurrency: int, num_products: int
+) -> Dict[str, Any]:
+    method, path, scenario = SCENARIOS[name]
+    headers = {"X-Scenario": scenario} if scenario else {}
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for i in remaining:
+            req_method, req_path = method, path
+            if method == "MIXED":
+                req_method, req_path = ("POST", f"{path}/checkout") if i % 2 else ("GET", f"{path}/catalog?include=inventory&limit=20")
+            if req_method == "GET":
+                # a fixed URL would only measure the v2 page cache after the first request
+                req_path += f"&offset={random.randrange(max(num_products - CATALOG_PAGE, 1))}"
+            body = checkout_body(num_products) if req_method == "POST" else None
+            start = time.perf_counter()
+            try:
+                resp = await client.request(req_method, req_path, headers=headers, json=body)
+                statuses[str(resp.status_code)] += 1
+            except httpx.HTTPError as exc:
+                statuses[type(exc).__name__] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    errors = sum(n for code, n in statuses.items() if not code.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_counts": dict(statuses),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(statistics.fmean(ordered), 2) if ordered else None,
+        "p50_ms": percentile(ordered, 50),
+        "p95_ms": percentile(ordered, 95),
+        "p99_ms": percentile(ordered, 99),
+    }
+
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if before.get(metric) and current.get(metric) and current[metric] > before[metric] * (1 + max_regression):
+                regressions.append(f"{name} {metric}: {before[metric]} -> {current[metric]}")
+        if before.get("throughput_rps") and current.get("throughput_rps"):
+            if current["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+                regressions.append(
+                    f"{name} throughput_rps: {before['throughput_rps']} -> {current['throughput_rps']}"
+                )
+    return regressions
+
+
+async def run(args) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+            for name in args.scenarios:
+                results[name] = await run_scenario(client, name, args.requests, args.concurrency, args.products)
+        return results
+
+    # In-process: the app reads DATABASE_URL at import, so point it at a scratch database first.
+    db_path = Path(tempfile.mkdtemp(prefix="skipline-bench-")) / "bench.db"
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ.setdefault("OUTBOX_WORKERS", "0")
+    from app.main import app
+    from scripts.seed import seed
+
+    await seed(args.products, random_seed=args.seed)
+    async with app.router.lifespan_context(app):
+        # count server errors in status_counts, as in HTTP mode, instead of aborting the run
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            for name in args.scenarios:
+                results[name] = await run_scenario(client, name, args.requests, args.concurrency, args.products)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Skipline v1 vs v2 benchmark")
+    parser.add_argument("-s", "--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("-n", "--requests", type=int, default=50, help="Requests per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="Concurrent clients")
+    parser.add_argument("-p", "--products", type=int, default=500, help="Products to seed (in-process mode)")
+    parser.add_argument("--base-url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("-o", "--output", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for request mixes and the dataset")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # the app and the seeder print progress; keep stdout for the report so it can be redirected
+    with contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(run(args))
+    report = {
+        "config": {
+            "mode": "http" if args.base_url else "in-process",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "products": args.products,
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["regressions"] = find_regressions(results, baseline, args.max_regression)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if report.get("regressions"):
+        print(f"❌ {len(report['regressions'])} regressions beyond {args.max_regression:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Per-request overhead of Sentry tracing/profiling settings.
+Runs scripts/benchmark.py once per setting (each in a fresh process, since the
+SDK is configured at import) and prints the latency/throughput of each side by side.
+Events go to a DSN nothing listens on, so only the in-process cost is measured.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BENCHMARK = Path(__file__).parent / "benchmark.py"
+NULL_DSN = "http://public@127.0.0.1:9/1"
+
+SETTINGS = {
+    "sentry_off": {"SENTRY_DSN": ""},
+    "trace_and_profile_all": {
+        "SENTRY_DSN": NULL_DSN,
+        "SENTRY_ROUTE_SAMPLE_RATES": "/=1.0",
+        "SENTRY_TRACES_PER_SECOND": "",
+        "SENTRY_PROFILE_SESSION_SAMPLE_RATE": "1.0",
+    },
+    "trace_all_no_profiles": {
+        "SENTRY_DSN": NULL_DSN,
+        "SENTRY_ROUTE_SAMPLE_RATES": "/=1.0",
+        "SENTRY_TRACES_PER_SECOND": "",
+        "SENTRY_PROFILE_SESSION_SAMPLE_RATE": "0",
+    },
+    "adaptive_default": {"SENTRY_DSN": NULL_DSN},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request overhead of Sentry sampling settings")
+    parser.add_argument("-s", "--scenarios", nargs="+", default=["v2_catalog", "v2_checkout"])
+    parser.add_argument("-n", "--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="Concurrent clients")
+    parser.add_argument("--settings", nargs="+", choices=sorted(SETTINGS), default=list(SETTINGS))
+    args = parser.parse_args()
+
+    summary = {}
+    for name in args.settings:
+        with tempfile.NamedTemporaryFile(suffix=".json") as out:
+            subprocess.run(
+                [
+                    sys.executable, str(BENCHMARK),
+                    "-s", *args.scenarios,
+                    "-n", str(args.requests),
+                    "-c", str(args.concurrency),
+                    "-o", out.name,
+                ],
+                env={**os.environ, "SENTRY_DEBUG": "false", **SETTINGS[name]},
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            results = json.load(open(out.name))["results"]
+        summary[name] = {
+            scenario: {k: r[k] for k in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")}
+            for scenario, r in results.items()
+        }
+        print(f"✅ {name}", file=sys.stderr)
+
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Per-row CPU of the v2 catalog serialization paths at a large page size.
+Compares the old ORM path (hydrate Product entities, model_validate each row,
+then FastAPI's response_model validation and JSON encoding) with the column-row
+fast path (plain rows straight to JSON bytes), and checks both produce the same bytes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Catalog serialization benchmark")
+    parser.add_argument("-l", "--limit", type=int, default=500, help="Rows per page")
+    parser.add_argument("-r", "--rounds", type=int, default=50, help="Pages serialized per path")
+    args = parser.parse_args()
+
+    db_path = Path(tempfile.mkdtemp(prefix="skipline-serial-")) / "bench.db"
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+
+    from app.db import SessionLocal
+    from app.models import Product
+    from app.schemas import ProductOut
+    from app.serialization import dumps, orjson
+    from app.services.catalog import CATALOG_COLUMNS
+    from scripts.seed import seed
+
+    await seed(args.limit)
+    adapter = TypeAdapter(List[ProductOut])
+
+    async with SessionLocal() as session:
+        async def orm_path() -> bytes:
+            session.expunge_all()
+            products = (await session.execute(select(Product).order_by(Product.id).limit(args.limit))).scalars().all()
+            result = [ProductOut.model_validate({**p.__dict__, "inventory": None}) for p in products]
+            # what FastAPI does with the return value and response_model
+            validated = adapter.validate_python(jsonable_encoder(result))
+            return json.dumps(
+                jsonable_encoder(validated), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+            ).encode("utf-8")
+
+        async def fast_path() -> bytes:
+            rows = (await session.execute(select(*CATALOG_COLUMNS).order_by(Product.id).limit(args.limit))).all()
+            return dumps(
+                [
+                    {
+                        "id": r.id,
+                        "name": r.name,
+                        "slug": r.slug,
+                        "category_id": r.category_id,
+                        "price_cents": r.price_cents,
+                        "image_url": r.image_url,
+                        "inventory": None,
+                    }
+                    for r in rows
+                ]
+            )
+
+        assert await orm_path() == await fast_path(), "fast path output differs from the ORM path"
+
+        report = {"limit": args.limit, "rounds": args.rounds, "encoder": "orjson" if orjson else "json"}
+        for name, path in (("orm", orm_path), ("fast", fast_path)):
+            cpu = time.process_time()
+            for _ in range(args.rounds):
+                await path()
+            per_row_us = (time.process_time() - cpu) / (args.rounds * args.limit) * 1e6
+            report[f"{name}_cpu_us_per_row"] = round(per_row_us, 2)
+        report["saved_cpu_us_per_row"] = round(report["orm_cpu_us_per_row"] - report["fast_cpu_us_per_row"], 2)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
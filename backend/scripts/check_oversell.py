@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Concurrency check for v2 checkout stock reservation.
+Seeds a scratch SQLite database, sets one SKU to --stock units and fires
+--requests concurrent single-unit checkouts at it through the ASGI app. Fails
+(exit 1) unless the balance never goes negative, exactly --stock orders are
+confirmed, and every other checkout is rejected with 409. Also checks that
+empty carts and non-positive quantities are refused before anything is written.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+
+PRODUCT_ID = 1
+
+
+async def run(args) -> List[str]:
+    # The app reads DATABASE_URL at import, so point it at a scratch database first.
+    db_path = Path(tempfile.mkdtemp(prefix="skipline-oversell-")) / "oversell.db"
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ.setdefault("OUTBOX_WORKERS", "0")
+    from sqlalchemy import func, select
+
+    from app.db import SessionLocal
+    from app.main import app
+    from app.models import InventoryBalance, Order
+    from app.services.inventory import record_movements, verify_inventory_balances
+    from scripts.seed import seed
+
+    await seed(5, movements_per_product=1, random_seed=args.seed)
+
+    async def balance() -> int:
+        async with SessionLocal() as session:
+            return (await session.get(InventoryBalance, PRODUCT_ID, populate_existing=True)).quantity
+
+    async with SessionLocal() as session:
+        await record_movements(session, [{"product_id": PRODUCT_ID, "delta": args.stock - await balance()}])
+        await session.commit()
+
+    failures: List[str] = []
+    lowest = args.stock
+    done = asyncio.Event()
+
+    async def watch_balance() -> None:
+        nonlocal lowest
+        while not done.is_set():
+            lowest = min(lowest, await balance())
+            await asyncio.sleep(0.005)
+
+    def cart(items):
+        return {"user_email": "oversell@skipline.app", "items": items, "address": "1 Main St, Springfield"}
+
+    async with app.router.lifespan_context(app):
+        # 5xx must come back as responses to be counted, not raised out of the transport
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=60.0) as client:
+            for name, items in (
+                ("empty cart", []),
+                ("negative quantity", [{"product_id": PRODUCT_ID, "quantity": -3}]),
+                ("zero quantity", [{"product_id": PRODUCT_ID, "quantity": 0}]),
+            ):
+                resp = await client.post("/api/v2/checkout", json=cart(items))
+                if resp.status_code != 422:
+                    failures.append(f"{name}: expected 422, got {resp.status_code}")
+
+            watcher = asyncio.create_task(watch_balance())
+            responses = await asyncio.gather(
+                *(
+                    client.post("/api/v2/checkout", json=cart([{"product_id": PRODUCT_ID, "quantity": 1}]))
+                    for _ in range(args.requests)
+                )
+            )
+            done.set()
+            await watcher
+
+    statuses = Counter(r.status_code for r in responses)
+    async with SessionLocal() as session:
+        confirmed = (
+            await session.execute(select(func.count()).select_from(Order).where(Order.status == "confirmed"))
+        ).scalar_one()
+        drift = await verify_inventory_balances(session)
+    final = await balance()
+    lowest = min(lowest, final)
+
+    print(f"stock={args.stock} requests={args.requests} statuses={dict(statuses)} confirmed={confirmed} final_balance={final}")
+    expected_ok = min(args.stock, args.requests)
+    if lowest < 0:
+        failures.append(f"balance went negative (lowest {lowest})")
+    if confirmed != expected_ok or statuses.get(200, 0) != expected_ok:
+        failures.append(f"expected {expected_ok} confirmed orders, got {confirmed} ({statuses.get(200, 0)} 200s)")
+    unexpected = {code: n for code, n in statuses.items() if code not in (200, 409)}
+    if unexpected:
+        failures.append(f"rejections other than 409: {unexpected}")
+    if final != args.stock - expected_ok:
+        failures.append(f"final balance {final}, expected {args.stock - expected_ok}")
+    if drift:
+        failures.append(f"balances drifted from the ledger: {drift}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer one SKU with concurrent v2 checkouts")
+    parser.add_argument("-n", "--requests", type=int, default=40, help="Concurrent checkouts")
+    parser.add_argument("--stock", type=int, default=20, help="Units of the SKU in stock")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the dataset")
+    args = parser.parse_args()
+
+    failures = asyncio.run(run(args))
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+    print("✅ No oversell: stock held and every rejection was a 409")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,29 @@ Database management script for Skipline backend.
 Handles export/import of data for migrations and inventory management.
 """
 import asyncio
+import gzip
+import hashlib
 import json
 import sys
-from datetime import datetime
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
 from pathlib import Path
+from typing import AsyncIterator, Optional
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from sqlalchemy import select
-from app.db import SessionLocal
-from app.models import Product, Category, InventoryMovement, Coupon, User, Order, OrderItem
+from sqlalchemy import DateTime, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.db import DATABASE_URL, Base, SessionLocal, engine, reset_id_sequences
+from app.models import Product, Category, InventoryBalance, InventoryMovement, Coupon, User, Order, OrderItem
+from app.services.inventory import (
+    rebuild_inventory_balances,
+    record_movements,
+    compact_movements,
+    compactable_products,
+    verify_inventory_balances,
+)
 
 
 async def export_data(output_file: str = "skipline_backup.json"):
@@ -128,27 +141,196 @@ async def export_data(output_file: str = "skipline_backup.json"):
         print(f"   - {len(order_items_data)} order items")
 
 
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+@asynccontextmanager
+async def _snapshot_connection(snapshot: Optional[str] = None) -> AsyncIterator[AsyncConnection]:
+    """A connection whose transaction reads one fixed snapshot; ``snapshot`` joins an exported Postgres one."""
+    async with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+            async with conn.begin():
+                if snapshot:
+                    # must be the first statement of the transaction; the id comes from pg_export_snapshot()
+                    await conn.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+                yield conn
+        else:
+            # pysqlite only opens a transaction before writes; an explicit BEGIN makes
+            # every SELECT read the same snapshot until the connection is released
+            await conn.exec_driver_sql("BEGIN")
+            yield conn
+
+
+async def _export_table(conn: AsyncConnection, table, out_dir: Path, chunk_size: int, compress: bool) -> dict:
+    """Stream one table to NDJSON in chunks on ``conn``; returns its manifest entry."""
+    filename = f"{table.name}.ndjson" + (".gz" if compress else "")
+    path = out_dir / filename
+    digest = hashlib.sha256()
+    rows = 0
+    # mtime=0 keeps the compressed file reproducible for identical data
+    raw = open(path, "wb")
+    out = gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) if compress else raw
+    try:
+        result = await conn.stream(
+            select(table).order_by(*table.primary_key.columns).execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.partitions():
+            chunk = b"".join(
+                json.dumps({k: _encode_value(v) for k, v in row._mapping.items()}, separators=(",", ":")).encode()
+                + b"\n"
+                for row in partition
+            )
+            digest.update(chunk)
+            rows += len(partition)
+            await asyncio.to_thread(out.write, chunk)
+    finally:
+        out.close()
+        if compress:
+            raw.close()
+    return {"file": filename, "rows": rows, "sha256": digest.hexdigest(), "bytes": path.stat().st_size}
+
+
+async def export_ndjson(
+    output_dir: str = "skipline_backup", chunk_size: int = 5000, compress: bool = True, concurrency: int = 4
+):
+    """Stream every table to its own NDJSON file from one consistent snapshot and write a manifest.
+
+    On PostgreSQL the tables are read concurrently, each connection joining the
+    snapshot exported by the first; elsewhere they are read one after another in
+    a single transaction.
+    """
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tables = Base.metadata.sorted_tables
+
+    async with _snapshot_connection() as leader:
+        if leader.dialect.name == "postgresql" and concurrency > 1:
+            # the leader's transaction stays open until every worker has joined and finished
+            snapshot = (await leader.exec_driver_sql("SELECT pg_export_snapshot()")).scalar_one()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def export_one(table):
+                async with semaphore, _snapshot_connection(snapshot) as conn:
+                    return table.name, await _export_table(conn, table, out_dir, chunk_size, compress)
+
+            entries = dict(await asyncio.gather(*(export_one(t) for t in tables)))
+        else:
+            entries = {t.name: await _export_table(leader, t, out_dir, chunk_size, compress) for t in tables}
+
+    manifest = {
+        "exported_at": datetime.now().isoformat(),
+        "format": "ndjson",
+        "compressed": compress,
+        "chunk_size": chunk_size,
+        # sorted_tables order: parents before children, safe to restore in this order
+        "tables": {t.name: entries[t.name] for t in tables},
+    }
+    with open(out_dir / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"✅ Data exported to {out_dir}/")
+    for name, entry in manifest["tables"].items():
+        print(f"   - {name}: {entry['rows']} rows ({entry['bytes']} bytes)")
+
+
+def _read_batches(path: Path, table, batch_size: int, digest):
+    """Yield lists of row dicts from an exported NDJSON file, feeding ``digest`` as it reads."""
+    datetime_columns = [c.name for c in table.columns if isinstance(c.type, DateTime)]
+    opener = gzip.open if path.suffix == ".gz" else open
+    batch = []
+    with opener(path, "rb") as f:
+        for line in f:
+            digest.update(line)
+            row = json.loads(line)
+            for name in datetime_columns:
+                if row.get(name) is not None:
+                    row[name] = datetime.fromisoformat(row[name])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+async def _load_batch(conn, table, batch, use_copy: bool):
+    if use_copy:
+        # asyncpg's COPY protocol: far fewer round trips than even batched INSERTs
+        columns = [c.name for c in table.columns]
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            table.name, records=[tuple(row.get(c) for c in columns) for row in batch], columns=columns
+        )
+    else:
+        await conn.execute(table.insert(), batch)
+
+
+async def import_ndjson(input_dir: str = "skipline_backup", batch_size: int = 5000, replace: bool = False):
+    """Bulk-load an ``export-ndjson`` directory in one transaction, verifying checksums."""
+    in_dir = Path(input_dir)
+    with open(in_dir / "manifest.json") as f:
+        manifest = json.load(f)
+    # parents before children, so foreign keys hold at every step
+    tables = [t for t in Base.metadata.sorted_tables if t.name in manifest["tables"]]
+    use_copy = DATABASE_URL.startswith("postgresql+asyncpg")
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        if replace:
+            for table in reversed(tables):
+                await conn.execute(table.delete())
+        # Secondary indexes are cheaper to build once over the loaded rows than to
+        # maintain row by row; primary keys and unique constraints stay in place.
+        indexes = [index for table in tables for index in table.indexes]
+        for index in indexes:
+            await conn.run_sync(lambda sync_conn, index=index: index.drop(sync_conn, checkfirst=True))
+
+        for table in tables:
+            entry = manifest["tables"][table.name]
+            digest = hashlib.sha256()
+            rows = 0
+            table_started = time.perf_counter()
+            for batch in _read_batches(in_dir / entry["file"], table, batch_size, digest):
+                await _load_batch(conn, table, batch, use_copy)
+                rows += len(batch)
+            if rows != entry["rows"] or digest.hexdigest() != entry["sha256"]:
+                raise ValueError(f"{entry['file']} does not match the manifest; nothing was imported")
+            elapsed = time.perf_counter() - table_started
+            print(f"   - {table.name}: {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)")
+
+        for index in indexes:
+            await conn.run_sync(lambda sync_conn, index=index: index.create(sync_conn, checkfirst=True))
+        await reset_id_sequences(conn, tables)
+
+    total = sum(manifest["tables"][t.name]["rows"] for t in tables)
+    elapsed = time.perf_counter() - started
+    print(f"✅ Imported {total} rows from {in_dir}/ in {elapsed:.2f}s")
+
+
 async def get_current_inventory():
     """Calculate and display current inventory levels."""
     async with SessionLocal() as session:
-        # Get all products
-        products = await session.execute(select(Product))
+        # One query for the whole report: stock comes from the maintained balances
+        rows = await session.execute(
+            select(Product.name, Product.price_cents, func.coalesce(InventoryBalance.quantity, 0))
+            .outerjoin(InventoryBalance, InventoryBalance.product_id == Product.id)
+            .order_by(Product.id)
+        )
         
         print("\n📦 Current Inventory Levels:")
         print("-" * 60)
         print(f"{'Product':<30} {'Current Stock':<15} {'Price':<10}")
         print("-" * 60)
         
-        for product in products.scalars():
-            # Calculate inventory from movements
-            movements = await session.execute(
-                select(InventoryMovement).where(
-                    InventoryMovement.product_id == product.id
-                )
-            )
-            
-            inventory = sum(m.delta for m in movements.scalars())
-            price = f"${product.price_cents / 100:.2f}"
+        for name, price_cents, inventory in rows:
+            price = f"${price_cents / 100:.2f}"
             
             # Color code based on stock level
             if inventory <= 0:
@@ -158,7 +340,7 @@ async def get_current_inventory():
             else:
                 status = "🟢"
                 
-            print(f"{status} {product.name:<28} {inventory:<15} {price:<10}")
+            print(f"{status} {name:<28} {inventory:<15} {price:<10}")
 
 
 async def adjust_inventory(product_id: int, delta: int, reason: str = "Manual adjustment"):
@@ -170,21 +352,11 @@ async def adjust_inventory(product_id: int, delta: int, reason: str = "Manual ad
             print(f"❌ Product with ID {product_id} not found")
             return
             
-        # Create inventory movement
-        movement = InventoryMovement(
-            product_id=product_id,
-            delta=delta
-        )
-        session.add(movement)
+        # Create inventory movement (updates the balance in the same transaction)
+        await record_movements(session, [{"product_id": product_id, "delta": delta}])
         await session.commit()
-        
-        # Calculate new inventory
-        movements = await session.execute(
-            select(InventoryMovement).where(
-                InventoryMovement.product_id == product_id
-            )
-        )
-        inventory = sum(m.delta for m in movements.scalars())
+
+        inventory = (await session.get(InventoryBalance, product_id, populate_existing=True)).quantity
         
         print(f"✅ Inventory adjusted for {product.name}")
         print(f"   Change: {'+' if delta > 0 else ''}{delta}")
@@ -192,6 +364,63 @@ async def adjust_inventory(product_id: int, delta: int, reason: str = "Manual ad
         print(f"   Reason: {reason}")
 
 
+async def rebuild_balances():
+    """Recompute the inventory balance table from the movement ledger."""
+    async with SessionLocal() as session:
+        count = await rebuild_inventory_balances(session)
+        await session.commit()
+        print(f"✅ Rebuilt inventory balances for {count} products")
+
+
+async def verify_balances() -> bool:
+    """Check the inventory balance table against the movement ledger."""
+    async with SessionLocal() as session:
+        mismatches = await verify_inventory_balances(session)
+
+    if not mismatches:
+        print("✅ Inventory balances match the ledger")
+        return True
+
+    print(f"❌ {len(mismatches)} products have drifted from the ledger:")
+    print(f"{'Product ID':<12} {'Balance':<10} {'Ledger':<10}")
+    for product_id, balance, ledger in mismatches:
+        print(f"{product_id:<12} {balance:<10} {ledger:<10}")
+    print("   Run `rebuild-balances` to repair them.")
+    return False
+
+
+async def compact_ledger(before: datetime, batch_size: int = 500, archive: Optional[str] = None) -> bool:
+    """Roll movements older than ``before`` into opening balances, ``batch_size`` products per transaction."""
+    async with SessionLocal() as session:
+        product_ids = await compactable_products(session, before)
+    if not product_ids:
+        print(f"✅ Nothing to compact before {before.isoformat()}")
+        return True
+
+    archive_file = gzip.open(archive, "wt") if archive else None
+    removed = 0
+    try:
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+            async with SessionLocal() as session:
+                deleted = await compact_movements(session, batch, before)
+                if archive_file:
+                    for row in deleted:
+                        archive_file.write(json.dumps({k: _encode_value(v) for k, v in row._mapping.items()}) + "\n")
+                await session.commit()
+            # each batch commits on its own, so the ledger total holds between batches
+            removed += len(deleted)
+            print(f"   - {min(start + batch_size, len(product_ids))}/{len(product_ids)} products, {removed} movements folded")
+    finally:
+        if archive_file:
+            archive_file.close()
+
+    print(f"✅ Compacted {removed} movements into {len(product_ids)} opening balances")
+    if archive:
+        print(f"   Originals archived to {archive}")
+    return await verify_balances()
+
+
 async def main():
     """Main CLI interface."""
     import argparse
@@ -203,6 +432,19 @@ async def main():
     export_parser = subparsers.add_parser("export", help="Export database to JSON")
     export_parser.add_argument("-o", "--output", default="skipline_backup.json", help="Output file")
     
+    # Streaming export command
+    ndjson_parser = subparsers.add_parser("export-ndjson", help="Stream every table to NDJSON files plus a manifest")
+    ndjson_parser.add_argument("-d", "--output-dir", default="skipline_backup", help="Output directory")
+    ndjson_parser.add_argument("--chunk-size", type=int, default=5000, help="Rows fetched and written per chunk")
+    ndjson_parser.add_argument("--no-gzip", action="store_true", help="Write plain .ndjson instead of .ndjson.gz")
+    ndjson_parser.add_argument("-j", "--concurrency", type=int, default=4, help="Tables exported at once (PostgreSQL; elsewhere one at a time)")
+    
+    # Import command
+    import_parser = subparsers.add_parser("import", help="Bulk-load an export-ndjson directory")
+    import_parser.add_argument("-d", "--input-dir", default="skipline_backup", help="Directory with manifest.json")
+    import_parser.add_argument("--batch-size", type=int, default=5000, help="Rows per INSERT batch or COPY")
+    import_parser.add_argument("--replace", action="store_true", help="Delete existing rows first")
+    
     # Inventory command
     inv_parser = subparsers.add_parser("inventory", help="Show current inventory")
     
@@ -212,14 +454,37 @@ async def main():
     adjust_parser.add_argument("delta", type=int, help="Inventory change (+ or -)")
     adjust_parser.add_argument("-r", "--reason", default="Manual adjustment", help="Reason for adjustment")
     
+    # Balance maintenance commands
+    subparsers.add_parser("rebuild-balances", help="Rebuild inventory balances from the ledger")
+    subparsers.add_parser("verify-balances", help="Verify inventory balances against the ledger")
+    
+    # Ledger compaction command
+    compact_parser = subparsers.add_parser("compact", help="Fold old inventory movements into opening balances")
+    compact_parser.add_argument("--older-than-days", type=int, default=90, help="Compact movements older than this")
+    compact_parser.add_argument("--batch-size", type=int, default=500, help="Products per transaction")
+    compact_parser.add_argument("--archive", help="Write the removed movements to this .ndjson.gz file")
+    
     args = parser.parse_args()
     
     if args.command == "export":
         await export_data(args.output)
+    elif args.command == "export-ndjson":
+        await export_ndjson(args.output_dir, args.chunk_size, not args.no_gzip, args.concurrency)
+    elif args.command == "import":
+        await import_ndjson(args.input_dir, args.batch_size, args.replace)
     elif args.command == "inventory":
         await get_current_inventory()
     elif args.command == "adjust":
         await adjust_inventory(args.product_id, args.delta, args.reason)
+    elif args.command == "rebuild-balances":
+        await rebuild_balances()
+    elif args.command == "verify-balances":
+        if not await verify_balances():
+            sys.exit(1)
+    elif args.command == "compact":
+        before = datetime.utcnow() - timedelta(days=args.older_than_days)
+        if not await compact_ledger(before, args.batch_size, args.archive):
+            sys.exit(1)
     else:
         parser.print_help()
 
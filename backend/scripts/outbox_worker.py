@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Standalone outbox worker for Skipline backend.
+Drains post-checkout side effects (confirmation emails) outside the API process.
+Run the API with OUTBOX_WORKERS=0 when using this instead of the in-app pool.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db import Base, SessionLocal, engine
+from app.services.outbox import OUTBOX_BATCH_SIZE, OutboxWorker
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Skipline outbox worker")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Handlers run at once")
+    parser.add_argument("-b", "--batch-size", type=int, default=OUTBOX_BATCH_SIZE, help="Events claimed per batch")
+    parser.add_argument("--once", action="store_true", help="Drain what is due now and exit")
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    worker = OutboxWorker(SessionLocal, concurrency=args.concurrency, batch_size=args.batch_size)
+    if args.once:
+        total = 0
+        while drained := await worker.drain_once():
+            total += drained
+        print(f"✅ Drained {total} outbox events ({worker.processed} delivered, {worker.failed} failed)")
+        return
+
+    print(f"📬 Outbox worker running (concurrency={args.concurrency}, batch={args.batch_size}); Ctrl+C to stop")
+    await worker.run()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
+import argparse
 import asyncio
 import random
+import sys
+import time
 from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterator, List
 
-from sqlalchemy import insert
-from sqlalchemy.ext.asyncio import AsyncSession
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from app.db import SessionLocal, engine
+from sqlalchemy import Table, insert
+
+from app.db import SessionLocal, engine, reset_id_sequences
 from app.db import Base
-from app.models import Category, Coupon, InventoryMovement, Product, User
+from app.db_config import is_sqlite
+from app.models import Category, Coupon, InventoryMovement, Order, OrderItem, Product, User
+from app.services.inventory import rebuild_inventory_balances
 
 
 CATEGORIES = [
@@ -19,58 +27,226 @@ CATEGORIES = [
     ("Style", "style"),
 ]
 
+PRICES = [1999, 2999, 4999, 9999]
+
+Rows = Iterator[List[dict]]
+
+
+def _chunked(rows: Iterator[dict], size: int) -> Rows:
+    chunk: List[dict] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _price(product_id: int, random_seed: int) -> int:
+    # Derived from the id alone so products and order items agree without sharing state.
+    return PRICES[random.Random(f"{random_seed}:price:{product_id}").randrange(len(PRICES))]
+
+
+def _categories(count: int) -> Iterator[dict]:
+    for i in range(1, count + 1):
+        name, slug = CATEGORIES[i - 1] if i <= len(CATEGORIES) else (f"Category {i}", f"category-{i}")
+        yield {"id": i, "name": name, "slug": slug}
+
+
+def _users(count: int) -> Iterator[dict]:
+    yield {"id": 1, "email": "demo@skipline.app"}
+    for i in range(2, count + 1):
+        yield {"id": i, "email": f"user{i}@skipline.app"}
+
+
+def _products(count: int, categories: int, random_seed: int) -> Iterator[dict]:
+    rng = random.Random(f"{random_seed}:products")
+    for i in range(1, count + 1):
+        yield {
+            "id": i,
+            "name": f"Product {i}",
+            "slug": f"product-{i}",
+            "category_id": rng.randint(1, categories),
+            "price_cents": _price(i, random_seed),
+            "image_url": "https://picsum.photos/seed/" + str(i) + "/400/400",
+        }
+
+
+def _coupons(extra: int, categories: int, random_seed: int, now: datetime) -> Iterator[dict]:
+    yield {"code": "SAVE10", "percent_off": 10, "starts_at": now - timedelta(days=1), "ends_at": now + timedelta(days=30), "min_subtotal_cents": 0, "applies_to_category_id": None}
+    yield {"code": "STYLE15", "percent_off": 15, "starts_at": now - timedelta(days=1), "ends_at": now + timedelta(days=10), "min_subtotal_cents": 5000, "applies_to_category_id": None}
+    yield {"code": "EXPIRED5", "percent_off": 5, "starts_at": now - timedelta(days=30), "ends_at": now - timedelta(days=1), "min_subtotal_cents": 0, "applies_to_category_id": None}
+    rng = random.Random(f"{random_seed}:coupons")
+    for i in range(1, extra + 1):
+        yield {
+            "code": f"PROMO{i}",
+            "percent_off": rng.choice([5, 10, 15, 20]),
+            "starts_at": now - timedelta(days=rng.randint(0, 30)),
+            "ends_at": now + timedelta(days=rng.randint(-5, 30)),
+            "min_subtotal_cents": rng.choice([0, 0, 2500, 5000]),
+            "applies_to_category_id": rng.choice([None, rng.randint(1, categories)]),
+        }
+
+
+def _movements(products: int, per_product: int, random_seed: int, start: datetime) -> Iterator[dict]:
+    rng = random.Random(f"{random_seed}:movements")
+    for pid in range(1, products + 1):
+        yield {"product_id": pid, "delta": rng.randint(0, 50), "created_at": start}
+        for d in range(1, per_product):
+            # simulate some purchases and restocks
+            yield {"product_id": pid, "delta": rng.choice([-1, 0, 0, 1]), "created_at": start + timedelta(days=d)}
+
 
-async def seed():
+def _items_for_order(order_id: int, products: int, random_seed: int) -> List[dict]:
+    # Seeded per order, so the orders and order_items tables stream independently.
+    rng = random.Random(f"{random_seed}:order:{order_id}")
+    items = []
+    for _ in range(rng.randint(1, 3)):
+        pid = rng.randint(1, products)
+        items.append(
+            {
+                "order_id": order_id,
+                "product_id": pid,
+                "quantity": rng.randint(1, 2),
+                "unit_price_cents": _price(pid, random_seed),
+            }
+        )
+    return items
+
+
+def _orders(count: int, users: int, products: int, random_seed: int) -> Iterator[dict]:
+    rng = random.Random(f"{random_seed}:orders")
+    for order_id in range(1, count + 1):
+        subtotal = sum(i["unit_price_cents"] * i["quantity"] for i in _items_for_order(order_id, products, random_seed))
+        shipping = 0 if subtotal >= 5000 else 599
+        tax = round(subtotal * 0.08)
+        yield {
+            "id": order_id,
+            "user_id": rng.randint(1, users),
+            "subtotal_cents": subtotal,
+            "discount_cents": 0,
+            "shipping_cents": shipping,
+            "tax_cents": tax,
+            "total_cents": subtotal + shipping + tax,
+            "status": "paid",
+        }
+
+
+def _order_items(count: int, products: int, random_seed: int) -> Iterator[dict]:
+    for order_id in range(1, count + 1):
+        yield from _items_for_order(order_id, products, random_seed)
+
+
+async def _load(table: Table, chunks: Rows) -> int:
+    """Insert ``chunks`` into ``table`` on its own session and report throughput."""
+    started = time.perf_counter()
+    rows = 0
+    async with SessionLocal() as session:
+        for chunk in chunks:
+            await session.execute(insert(table), chunk)
+            rows += len(chunk)
+        await session.commit()
+    elapsed = time.perf_counter() - started
+    print(f"   - {table.name}: {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)")
+    return rows
+
+
+async def _load_stage(loads: List[Callable[[], Rows]], tables: List[Table], concurrent: bool) -> None:
+    if concurrent:
+        await asyncio.gather(*(_load(t, load()) for t, load in zip(tables, loads)))
+    else:
+        for t, load in zip(tables, loads):
+            await _load(t, load())
+
+
+async def seed(
+    num_products: int = 500,
+    *,
+    categories: int = len(CATEGORIES),
+    movements_per_product: int = 90,
+    users: int = 1,
+    orders: int = 0,
+    coupons: int = 0,
+    random_seed: int = 1,
+    chunk_size: int = 10000,
+    concurrent: bool = False,
+):
+    """Generate a repeatable dataset: the same arguments always produce the same rows.
+
+    Rows get explicit ids so tables can be generated independently; with
+    ``concurrent`` the tables in each stage load at the same time (parents in an
+    earlier stage than their children). ``coupons`` adds generated codes on top of
+    the fixed demo ones. Expects an empty database.
+    """
     # Ensure tables exist when running seed directly (no server lifespan)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    async with SessionLocal() as session:  # type: AsyncSession
-        await session.execute(insert(User).values({"email": "demo@skipline.app"}))
-
-        category_ids = []
-        for name, slug in CATEGORIES:
-            res = await session.execute(insert(Category).values({"name": name, "slug": slug}).returning(Category.id))
-            category_ids.append(res.scalar_one())
-
-        products = []
-        for i in range(1, 501):
-            cat_id = random.choice(category_ids)
-            products.append(
-                {
-                    "name": f"Product {i}",
-                    "slug": f"product-{i}",
-                    "category_id": cat_id,
-                    "price_cents": random.choice([1999, 2999, 4999, 9999]),
-                    "image_url": "https://picsum.photos/seed/" + str(i) + "/400/400",
-                }
-            )
-        res = await session.execute(insert(Product).returning(Product.id), products)
-        product_ids = [r for r in res.scalars().all()]
-
-        # inventory movements
-        start = datetime.utcnow() - timedelta(days=120)
-        movements = []
-        for pid in product_ids:
-            stock = random.randint(0, 50)
-            movements.append({"product_id": pid, "delta": stock, "created_at": start})
-            for d in range(1, 90):
-                # simulate some purchases and restocks
-                movements.append({"product_id": pid, "delta": random.choice([-1, 0, 0, 1]), "created_at": start + timedelta(days=d)})
-        # chunk inserts
-        for i in range(0, len(movements), 5000):
-            await session.execute(insert(InventoryMovement), movements[i : i + 5000])
-
-        now = datetime.utcnow()
-        coupons = [
-            {"code": "SAVE10", "percent_off": 10, "starts_at": now - timedelta(days=1), "ends_at": now + timedelta(days=30), "min_subtotal_cents": 0},
-            {"code": "STYLE15", "percent_off": 15, "starts_at": now - timedelta(days=1), "ends_at": now + timedelta(days=10), "min_subtotal_cents": 5000},
-            {"code": "EXPIRED5", "percent_off": 5, "starts_at": now - timedelta(days=30), "ends_at": now - timedelta(days=1), "min_subtotal_cents": 0},
-        ]
-        await session.execute(insert(Coupon), coupons)
+    # SQLite has a single writer, so concurrent loads would only wait on each other
+    concurrent = concurrent and not is_sqlite()
+    now = datetime.utcnow()
+    start = now - timedelta(days=max(movements_per_product, 1) + 30)
+    started = time.perf_counter()
+
+    await _load_stage(
+        [lambda: _chunked(_categories(categories), chunk_size), lambda: _chunked(_users(max(users, 1)), chunk_size)],
+        [Category.__table__, User.__table__],
+        concurrent,
+    )
+    await _load_stage(
+        [
+            lambda: _chunked(_products(num_products, categories, random_seed), chunk_size),
+            lambda: _chunked(_coupons(coupons, categories, random_seed, now), chunk_size),
+        ],
+        [Product.__table__, Coupon.__table__],
+        concurrent,
+    )
+    await _load_stage(
+        [
+            lambda: _chunked(_movements(num_products, movements_per_product, random_seed, start), chunk_size),
+            lambda: _chunked(_orders(orders, max(users, 1), num_products, random_seed), chunk_size),
+        ],
+        [InventoryMovement.__table__, Order.__table__],
+        concurrent,
+    )
+    await _load(OrderItem.__table__, _chunked(_order_items(orders, num_products, random_seed), chunk_size))
 
+    async with SessionLocal() as session:
+        # one INSERT ... SELECT over the finished ledger instead of an upsert per chunk
+        await rebuild_inventory_balances(session)
         await session.commit()
-        print("Seed complete")
+    async with engine.begin() as conn:
+        await reset_id_sequences(conn, [Category.__table__, User.__table__, Product.__table__, Order.__table__])
+
+    print(f"Seed complete in {time.perf_counter() - started:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a repeatable Skipline dataset")
+    parser.add_argument("-p", "--products", type=int, default=500)
+    parser.add_argument("--categories", type=int, default=len(CATEGORIES))
+    parser.add_argument("--movements-per-product", type=int, default=90)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--orders", type=int, default=0)
+    parser.add_argument("--coupons", type=int, default=0, help="Generated coupons on top of the demo codes")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed; same seed, same dataset")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows per INSERT batch")
+    parser.add_argument("--concurrent", action="store_true", help="Load independent tables at once (not on SQLite)")
+    args = parser.parse_args()
+    asyncio.run(
+        seed(
+            args.products,
+            categories=args.categories,
+            movements_per_product=args.movements_per_product,
+            users=args.users,
+            orders=args.orders,
+            coupons=args.coupons,
+            random_seed=args.seed,
+            chunk_size=args.chunk_size,
+            concurrent=args.concurrent,
+        )
+    )
 
 
 if __name__ == "__main__":
-    asyncio.run(seed())
+    main()